@@ -0,0 +1,64 @@
+import time
+import argparse
+import pandas as pd
+
+from Sastrawi.StopWordRemover.StopWordRemoverFactory import StopWordRemoverFactory
+from utils.preprocessor import TwitterDataModule
+from utils.cleaner import clean_text_series, clean_text_series_parallel
+
+# Usage: python -m benchmarks.cleaning [--repeat 4] [--workers 8]
+
+BENCHMARK_DATASETS = [
+    "datasets/CombinedDataset/test.csv",
+    "datasets/CombinedDataset/validation.csv",
+    "datasets/GithubTest/train.csv",
+    "datasets/GithubTest/validation.csv",
+    "datasets/GithubTest/test.csv",
+    "datasets/MendaleyTest/train.csv",
+    "datasets/MendaleyTest/validation.csv",
+    "datasets/MendaleyTest/test.csv",
+]
+
+
+def as_list(texts):
+    return [None if pd.isna(text) else text for text in texts]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='clean_tweet vs vectorized cleaner benchmark')
+    parser.add_argument('--repeat', type=int, default=1, help='Repeat the corpus N times to simulate a larger one')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for the parallel cleaner')
+    parser.add_argument('--chunk_size', type=int, default=20000, help='Rows per parallel chunk')
+
+    args = parser.parse_args()
+
+    texts = pd.concat([pd.read_csv(path)["text"] for path in BENCHMARK_DATASETS] * args.repeat, ignore_index=True)
+    texts = texts.dropna().reset_index(drop=True)
+
+    data_module = TwitterDataModule(tokenizer=None, cache_dir=None)
+    data_module.stop_words = StopWordRemoverFactory().get_stop_words()
+
+    start = time.perf_counter()
+    reference = texts.apply(data_module.clean_tweet)
+    apply_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = clean_text_series(texts, data_module.stop_words)
+    vectorized_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = clean_text_series_parallel(texts, data_module.stop_words, num_workers=args.workers, chunk_size=args.chunk_size)
+    parallel_time = time.perf_counter() - start
+
+    reference = as_list(reference)
+
+    print()
+    print(f' Rows: {len(texts)}')
+    print('-' * 62)
+    print(f' {"Mode":<12}| {"Seconds":>9} | {"Rows/s":>10} | {"Speedup":>8} | {"Identical":>9}')
+    print('-' * 62)
+    for mode, seconds, output in [('apply', apply_time, reference), ('vectorized', vectorized_time, vectorized), ('parallel', parallel_time, parallel)]:
+        identical = as_list(output) == reference
+        print(f' {mode:<12}| {seconds:>9.2f} | {len(texts) / seconds:>10.0f} | {apply_time / seconds:>7.1f}x | {str(identical):>9}')
+    print('-' * 62)
@@ -0,0 +1,90 @@
+import time
+import argparse
+import torch
+
+from models.factory import get_model_class, load_backbone, pretrained_model_name
+
+# Usage: python -m benchmarks.compile -m IndoBERT [-b 32] [-l 128] [--steps 10]
+
+VARIANTS = [(False, 1), (False, 2), (True, 1), (True, 2)]
+MODES = [('eager', 'eager', False), ('sdpa', 'sdpa', False), ('sdpa + compile', 'sdpa', True)]
+
+
+def median_ms(function, steps):
+    # The first call pays for compilation, it is reported on its own
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+
+    seconds = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+
+    return first * 1000, sorted(seconds)[len(seconds) // 2] * 1000
+
+
+def build(pretrained_name, cnn, version, attn_implementation, compile_model):
+    torch.manual_seed(42)
+    model = get_model_class(cnn, version)(model=load_backbone(pretrained_name, cnn, version, attn_implementation=attn_implementation))
+    if compile_model:
+        model.compile_forward()
+    return model
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Eager vs SDPA vs compiled forward for every model variant')
+    parser.add_argument('-m', '--model', default='IndoBERT', help='Model name from main.py or a local model path')
+    parser.add_argument('-b', '--batch_size', type=int, default=32, help='Batch size')
+    parser.add_argument('-l', '--max_length', type=int, default=128, help='Maximum sequence length')
+    parser.add_argument('--steps', type=int, default=10, help='Timed steps after the first call')
+    parser.add_argument('--no_train', action='store_true', help='Only time the inference forward')
+
+    args = parser.parse_args()
+
+    pretrained_name = pretrained_model_name.get(args.model, args.model)
+    input_ids = torch.randint(5, 1000, (args.batch_size, args.max_length))
+    attention_mask = torch.ones_like(input_ids)
+
+    results = []
+    for cnn, version in VARIANTS:
+        targets = torch.nn.functional.one_hot(torch.randint(0, 2, (args.batch_size,)), num_classes=2).float() if not cnn and version == 1 else torch.randint(0, 2, (args.batch_size,)).float()
+
+        for mode, attn_implementation, compile_model in MODES:
+            model = build(pretrained_name, cnn, version, attn_implementation, compile_model).eval()
+
+            def infer():
+                with torch.no_grad():
+                    model(input_ids=input_ids, attention_mask=attention_mask)
+
+            infer_first, infer_ms = median_ms(infer, args.steps)
+
+            train_ms = None
+            if not args.no_train:
+                model.train()
+                optimizer = model.configure_optimizers()
+
+                def train():
+                    loss = model.compute_loss(model(input_ids=input_ids, attention_mask=attention_mask), targets)
+                    optimizer.zero_grad()
+                    loss.backward()
+                    optimizer.step()
+
+                _, train_ms = median_ms(train, args.steps)
+
+            # compiled_logits is reset when compilation failed and the forward fell back to eager
+            active = mode if not compile_model or model.compiled_logits is not None else f'{mode} (fallback)'
+            results.append((f'{"CNN " if cnn else ""}v{version}', active, infer_first, infer_ms, train_ms))
+
+    print()
+    print(f' Model: {args.model} | Batch Size: {args.batch_size} | Max Length: {args.max_length} | Threads: {torch.get_num_threads()}')
+    print('-' * 86)
+    print(f' {"Variant":<8}| {"Mode":<25}| {"First call ms":>13} | {"Infer ms":>9} | {"Train ms":>9} | {"Infer speedup":>13}')
+    print('-' * 86)
+    for index, (variant, mode, infer_first, infer_ms, train_ms) in enumerate(results):
+        baseline = results[index - index % len(MODES)][3]
+        train = f'{train_ms:>9.1f}' if train_ms is not None else f'{"-":>9}'
+        print(f' {variant:<8}| {mode:<25}| {infer_first:>13.0f} | {infer_ms:>9.1f} | {train} | {baseline / infer_ms:>12.2f}x')
+    print('-' * 86)
@@ -0,0 +1,93 @@
+import time
+import argparse
+import threading
+import requests
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tools.fetcher import PageFetcher, extract_page
+
+# Usage: python -m benchmarks.fetcher [--hosts 3] [--pages 5] [--queries 4] [--delay 0.5]
+
+ARTICLE = """<html><head><title>Stub article {path}</title><meta name="author" content="Stub Author"></head>
+<body><article><h1>Stub article {path}</h1>{paragraphs}</article></body></html>"""
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (benchmark)'}
+
+
+def start_stub_server(delay):
+    paragraphs = "".join(f"<p>Paragraph {index} of the stub article, long enough for the extractor to keep it as body text rather than boilerplate.</p>" for index in range(40))
+
+    class StubHandler(BaseHTTPRequestHandler):
+
+        # Every page answers after delay seconds, like a slow news site
+        def do_GET(self):
+            time.sleep(delay)
+            body = ARTICLE.format(path = self.path, paragraphs = paragraphs).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+
+def serial_fetch(urls, timeout):
+    # What visit_content did before, one blocking request and extraction after another with no connection reuse
+    page_contents = []
+    for url in urls:
+        page_raw = requests.get(url, headers = HEADERS, timeout = timeout, verify = False)
+        page_contents.append(extract_page(page_raw.text))
+    return page_contents
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Serial vs concurrent search hit downloads against local stub news sites')
+    parser.add_argument('--hosts', type=int, default=3, help='Stub servers, each one is a separate host for the per-host limit')
+    parser.add_argument('--pages', type=int, default=5, help='Search hits per query, spread over the hosts')
+    parser.add_argument('--queries', type=int, default=4, help='Queries per run')
+    parser.add_argument('--delay', type=float, default=0.5, help='Seconds every stub page takes to answer')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent downloads')
+    parser.add_argument('--per_host', type=int, default=2, help='Concurrent downloads per host')
+    parser.add_argument('--extract_workers', type=int, default=None, help='Extraction processes, 0 extracts in the download threads')
+
+    args = parser.parse_args()
+
+    servers = [start_stub_server(args.delay) for _ in range(args.hosts)]
+    queries = [[f"http://127.0.0.1:{servers[page % args.hosts].server_address[1]}/query{query}/page{page}" for page in range(args.pages)] for query in range(args.queries)]
+
+    results = []
+
+    start = time.perf_counter()
+    serial_pages = [serial_fetch(urls, timeout = 10) for urls in queries]
+    results.append(('serial', time.perf_counter() - start, serial_pages))
+
+    fetcher = PageFetcher(headers = HEADERS, workers = args.workers, per_host = args.per_host, extract_workers = args.extract_workers)
+    # The extraction processes start on first use, warm them up so the timing is the steady state
+    fetcher.fetch_all(queries[0][:1])
+
+    start = time.perf_counter()
+    concurrent_pages = [fetcher.fetch_all(urls) for urls in queries]
+    results.append((f'concurrent ({args.workers} workers, {args.per_host}/host)', time.perf_counter() - start, concurrent_pages))
+    fetcher.close()
+
+    assert concurrent_pages == serial_pages, 'Concurrent fetch extracted different page contents'
+
+    total_pages = args.pages * args.queries
+    print()
+    print(f' Hosts: {args.hosts} | Pages/query: {args.pages} | Queries: {args.queries} | Page delay: {args.delay}s')
+    print('-' * 78)
+    print(f' {"Mode":<36}| {"Seconds":>8} | {"s/query":>8} | {"Pages/s":>8} | {"Speedup":>7}')
+    print('-' * 78)
+    for mode, seconds, _ in results:
+        print(f' {mode:<36}| {seconds:>8.2f} | {seconds / args.queries:>8.2f} | {total_pages / seconds:>8.1f} | {results[0][1] / seconds:>6.2f}x')
+    print('-' * 78)
+
+    for server in servers:
+        server.shutdown()
@@ -0,0 +1,118 @@
+import time
+import resource
+import argparse
+import multiprocessing
+import torch
+
+from torch import nn
+from models.factory import build_model, pretrained_model_name
+from models.heads import HIDDEN_STATES_MODES
+
+# Usage: python -m benchmarks.hidden_states -m IndoBERT [-v 1 2] [-b 32] [-l 128] [--steps 10]
+# Checks first that top_k gives the logits of all, also with the dynamic INT8 quantization of inference.py --quantize
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def check_outputs(pretrained_name, version, batch_size, max_length):
+    # top_k must give the logits of all, in fp32 and after the dynamic INT8 quantization InferenceEngine applies with quantize=True
+    torch.manual_seed(42)
+    models = {hidden_states: build_model(pretrained_name, cnn=True, version=version, hidden_states=hidden_states).eval() for hidden_states in HIDDEN_STATES_MODES}
+    for model in models.values():
+        model.load_state_dict(models['all'].state_dict())
+
+    input_ids = torch.randint(5, models['all'].model.config.vocab_size, (batch_size, max_length))
+    attention_mask = torch.ones_like(input_ids)
+
+    same = {}
+    with torch.inference_mode():
+        for precision in ['fp32', 'int8']:
+            logits = []
+            for model in models.values():
+                if precision == 'int8':
+                    model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+                logits.append(model(input_ids=input_ids, attention_mask=attention_mask))
+            same[precision] = all(torch.allclose(logits[0], other, atol=1e-4) for other in logits[1:])
+    return same
+
+
+def run(pretrained_name, version, hidden_states, batch_size, max_length, steps, train):
+    torch.manual_seed(42)
+    model = build_model(pretrained_name, cnn=True, version=version, hidden_states=hidden_states)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model.to(device).train(train)
+    optimizer = model.configure_optimizers()
+
+    input_ids = torch.randint(5, model.model.config.vocab_size, (batch_size, max_length), device=device)
+    attention_mask = torch.ones_like(input_ids)
+    targets = torch.randint(0, 2, (batch_size,), device=device).float()
+
+    # The process peak so far is the model and optimizer, whatever it grows by is the step itself
+    if device.type == 'cuda':
+        torch.cuda.reset_peak_memory_stats()
+        baseline = torch.cuda.memory_allocated() / 2 ** 20
+    else:
+        baseline = peak_rss_mb()
+
+    seconds = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        if train:
+            loss = model.compute_loss(model(input_ids=input_ids, attention_mask=attention_mask), targets)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+        else:
+            with torch.inference_mode():
+                model(input_ids=input_ids, attention_mask=attention_mask)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        seconds.append(time.perf_counter() - start)
+
+    peak = torch.cuda.max_memory_allocated() / 2 ** 20 if device.type == 'cuda' else peak_rss_mb()
+
+    # The first step warms up allocators and kernels, the median of the rest is the step time
+    steady = sorted(seconds[1:] or seconds)
+    return peak - baseline, steady[len(steady) // 2] * 1000
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='CNN head memory and step time with all vs top-k hidden states')
+    parser.add_argument('-m', '--model', default='IndoBERT', help='Model name from main.py or a local model path')
+    parser.add_argument('-v', '--versions', type=int, nargs='+', choices=[1, 2], default=[1, 2], help='CNN head versions')
+    parser.add_argument('-b', '--batch_size', type=int, default=32, help='Batch size')
+    parser.add_argument('-l', '--max_length', type=int, default=128, help='Maximum sequence length')
+    parser.add_argument('--steps', type=int, default=10, help='Steps per measurement')
+
+    args = parser.parse_args()
+
+    pretrained_name = pretrained_model_name.get(args.model, args.model)
+
+    # Every run gets a fresh process, so the RSS peak of one cannot hide the next
+    context = multiprocessing.get_context('spawn')
+
+    for version in args.versions:
+        same = check_outputs(pretrained_name, version, min(args.batch_size, 4), args.max_length)
+        print(f'[ CNN v{version} top_k vs all logits, fp32: {"same" if same["fp32"] else "DIFFERENT"} | int8: {"same" if same["int8"] else "DIFFERENT"} ]')
+
+    results = []
+    for version in args.versions:
+        for train in [True, False]:
+            for hidden_states in HIDDEN_STATES_MODES:
+                with context.Pool(1) as pool:
+                    memory, step_ms = pool.apply(run, (pretrained_name, version, hidden_states, args.batch_size, args.max_length, args.steps, train))
+                results.append((version, 'train' if train else 'infer', hidden_states, memory, step_ms))
+
+    print()
+    print(f' Model: {args.model} | Batch Size: {args.batch_size} | Max Length: {args.max_length} | Device: {"cuda" if torch.cuda.is_available() else "cpu"}')
+    print('-' * 72)
+    print(f' {"Head":<12}| {"Pass":<6}| {"Hidden states":<14}| {"Peak MB":>8} | {"Step ms":>8} | {"Speedup":>7}')
+    print('-' * 72)
+    for index, (version, step, hidden_states, memory, step_ms) in enumerate(results):
+        baseline = results[index - index % len(HIDDEN_STATES_MODES)]
+        print(f' {f"CNN v{version}":<12}| {step:<6}| {hidden_states:<14}| {memory:>8.0f} | {step_ms:>8.1f} | {baseline[4] / step_ms:>6.2f}x')
+    print('-' * 72)
@@ -0,0 +1,68 @@
+import time
+import argparse
+import torch
+
+from transformers import AutoTokenizer
+from models.factory import build_model, uses_one_hot_label, pretrained_model_name
+from utils.preprocessor import TwitterDataModule
+
+# Usage: python -m benchmarks.padding -m IndoBERT [-c] [-v 2] [--max_batches 50]
+
+
+def run_epoch(model, dataloader, max_batches=None):
+    optimizer = model.configure_optimizers()
+    model.train()
+
+    real_tokens, padded_tokens, batches = 0, 0, 0
+    start = time.perf_counter()
+    for batch_idx, batch in enumerate(dataloader):
+        if max_batches is not None and batch_idx >= max_batches:
+            break
+
+        loss = model.training_step(batch, batch_idx)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+        real_tokens += int(batch[1].sum())
+        padded_tokens += batch[1].numel()
+        batches += 1
+
+    return time.perf_counter() - start, real_tokens, padded_tokens, batches
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Fixed vs dynamic padding training benchmark on CPU')
+    parser.add_argument('-m', '--model', default='IndoBERT', help='Model name from main.py or a local model path')
+    parser.add_argument('-b', '--batch_size', type=int, default=32, help='Batch size')
+    parser.add_argument('-l', '--max_length', type=int, default=128, help='Maximum sequence length')
+    parser.add_argument('-c', '--cnn', action='store_true', help='Benchmark the CNN head')
+    parser.add_argument('-v', '--version', type=int, choices=[1, 2], default=1, help='Model Version')
+    parser.add_argument('--max_batches', type=int, default=None, help='Stop each epoch after N batches')
+
+    args = parser.parse_args()
+
+    pretrained_name = pretrained_model_name.get(args.model, args.model)
+    tokenizer = AutoTokenizer.from_pretrained(pretrained_name, use_fast=False)
+
+    results = []
+    for padding_mode in ['max_length', 'dynamic']:
+        torch.manual_seed(42)
+        model = build_model(pretrained_name, cnn=args.cnn, version=args.version)
+
+        data_module = TwitterDataModule(tokenizer=tokenizer, max_length=args.max_length, batch_size=args.batch_size, one_hot_label=uses_one_hot_label(args.cnn, args.version), padding_mode=padding_mode)
+        data_module.setup('fit')
+
+        seconds, real_tokens, padded_tokens, batches = run_epoch(model, data_module.train_dataloader(), max_batches=args.max_batches)
+        results.append((padding_mode, seconds, real_tokens, padded_tokens, batches))
+
+    print()
+    print(f' Model: {args.model} | CNN: {args.cnn} | Version: {args.version} | Batch Size: {args.batch_size} | Max Length: {args.max_length}')
+    print('-' * 86)
+    print(f' {"Padding":<11}| {"Batches":>7} | {"Epoch s":>8} | {"Real tok/s":>10} | {"Padded tok/s":>12} | {"Pad ratio":>9} | {"Speedup":>7}')
+    print('-' * 86)
+    baseline = results[0][1] / results[0][4]
+    for padding_mode, seconds, real_tokens, padded_tokens, batches in results:
+        print(f' {padding_mode:<11}| {batches:>7} | {seconds:>8.1f} | {real_tokens / seconds:>10.0f} | {padded_tokens / seconds:>12.0f} | {1 - real_tokens / padded_tokens:>9.1%} | {baseline / (seconds / batches):>6.2f}x')
+    print('-' * 86)
@@ -0,0 +1,88 @@
+import gc
+import argparse
+import torch
+import pandas as pd
+
+from torch.nn import functional as F
+from torch.utils.data import DataLoader, TensorDataset
+from transformers import AutoTokenizer
+from pytorch_lightning import Trainer, seed_everything
+from Sastrawi.StopWordRemover.StopWordRemoverFactory import StopWordRemoverFactory
+from models.factory import build_model, uses_one_hot_label, pretrained_model_name
+from utils.cleaner import clean_text_series
+from utils.loader import tensor_batch_sampler
+from utils.runtime import EpochTimer, configure_threads, resolve_precision
+from utils.tokenization import encode_slow
+
+# Usage: python -m benchmarks.precision -m IndoBERT [--data datasets/train.csv] [--limit 512] [--precisions 32 bf16]
+
+
+def load_tensors(data_path, tokenizer, max_length, one_hot_label, limit=None):
+    dataset = pd.read_csv(data_path)
+    if limit is not None:
+        dataset = dataset.head(limit)
+
+    # Same cleaning and Headline [SEP] text composition as TwitterDataModule, only the text is cleaned
+    texts = clean_text_series(dataset['text'].astype(str), StopWordRemoverFactory().get_stop_words()).fillna('')
+    input_ids, attention_mask = encode_slow(tokenizer, [f"{Headline} [SEP] {text}" for Headline, text in zip(dataset['Headline'], texts)], max_length)
+
+    labels = torch.tensor(dataset['label'].to_numpy(dtype='int64'))
+    labels = F.one_hot(labels, num_classes=2).float() if one_hot_label else labels.float()
+
+    return TensorDataset(input_ids, attention_mask, labels)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='CPU training epoch time at fp32 vs bf16 autocast')
+    parser.add_argument('-m', '--model', default='IndoBERT', help='Model name from main.py or a local model path')
+    parser.add_argument('-c', '--cnn', action='store_true', help='Benchmark the CNN head')
+    parser.add_argument('-v', '--version', type=int, choices=[1, 2], default=1, help='Model Version')
+    parser.add_argument('-d', '--data', default='datasets/train.csv', help='Labelled CSV to train one epoch on')
+    parser.add_argument('--limit', type=int, default=None, help='Only train on the first N rows')
+    parser.add_argument('-b', '--batch_size', type=int, default=32, help='Batch size')
+    parser.add_argument('-l', '--max_length', type=int, default=128, help='Maximum sequence length')
+    parser.add_argument('--precisions', nargs='+', choices=['32', 'bf16'], default=['32', 'bf16'], help='Precisions to compare')
+    parser.add_argument('--num_threads', default='auto', help="Intra-op threads, 'auto' uses every usable CPU on every socket")
+    parser.add_argument('--interop_threads', default='auto', help="Inter-op threads, 'auto' is one per socket")
+
+    args = parser.parse_args()
+
+    num_threads, interop_threads = configure_threads(args.num_threads, args.interop_threads)
+
+    pretrained_name = pretrained_model_name.get(args.model, args.model)
+    tokenizer = AutoTokenizer.from_pretrained(pretrained_name, use_fast=False)
+    dataset = load_tensors(args.data, tokenizer, args.max_length, uses_one_hot_label(args.cnn, args.version), limit=args.limit)
+
+    results = []
+    for precision in args.precisions:
+        seed_everything(42)
+        model = build_model(pretrained_name, cnn=args.cnn, version=args.version)
+        epoch_timer = EpochTimer()
+
+        trainer = Trainer(
+            accelerator='cpu',
+            precision=resolve_precision(precision, 'cpu'),
+            max_epochs=1,
+            limit_val_batches=0,
+            callbacks=[epoch_timer],
+            logger=False,
+            enable_checkpointing=False,
+            enable_model_summary=False,
+        )
+        trainer.fit(model, DataLoader(dataset, sampler=tensor_batch_sampler(dataset, args.batch_size, shuffle=True), batch_size=None))
+
+        results.append((precision, epoch_timer.epoch_times[0], float(trainer.callback_metrics['train_loss_epoch'])))
+
+        # A base-size model with its Adam state is ~2GB, drop it before the next precision builds its own
+        del model, trainer
+        gc.collect()
+
+    print()
+    print(f' Model: {args.model} | CNN: {args.cnn} | Version: {args.version} | Rows: {len(dataset)} | Threads: {num_threads} intra, {interop_threads} inter-op')
+    print('-' * 66)
+    print(f' {"Precision":<10}| {"Epoch s":>8} | {"Rows/s":>8} | {"Train loss":>10} | {"Speedup":>7}')
+    print('-' * 66)
+    for precision, seconds, loss in results:
+        print(f' {precision:<10}| {seconds:>8.1f} | {len(dataset) / seconds:>8.1f} | {loss:>10.4f} | {results[0][1] / seconds:>6.2f}x')
+    print('-' * 66)
@@ -0,0 +1,48 @@
+import os
+import time
+import argparse
+
+from utils.preprocessor import TwitterDataModule
+from utils.processed_store import processed_path, read_processed, write_processed
+
+# Usage: python -m benchmarks.processed_format [--repeat 3]
+
+
+def timed(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Processed dataset CSV vs Parquet benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Best of N timings')
+
+    args = parser.parse_args()
+
+    data_module = TwitterDataModule(tokenizer=None, recreate=True, cache_dir=None)
+    dataset = data_module.load_processed_dataset()
+
+    results = []
+    for processed_format in ['csv', 'parquet']:
+        path = processed_path(data_module.processed_dataset_path, processed_format)
+
+        write_time, _ = timed(lambda: write_processed(dataset, path, processed_format), args.repeat)
+        read_time, full = timed(lambda: read_processed(path, processed_format), args.repeat)
+        test_time, test = timed(lambda: read_processed(path, processed_format, columns=["text", "Headline", "label", "step"], steps=['test']), args.repeat)
+        labels_time, _ = timed(lambda: read_processed(path, processed_format, columns=["label", "step"]), args.repeat)
+
+        results.append((processed_format, os.path.getsize(path), write_time, read_time, test_time, labels_time, len(full), len(test)))
+
+    print()
+    print(f' Rows: {len(dataset)}')
+    print('-' * 84)
+    print(f' {"Format":<8}| {"Size MB":>8} | {"Write s":>8} | {"Read all s":>10} | {"Read test s":>11} | {"Labels only s":>13} | {"Rows":>6}')
+    print('-' * 84)
+    for processed_format, size, write_time, read_time, test_time, labels_time, rows, test_rows in results:
+        print(f' {processed_format:<8}| {size / 2 ** 20:>8.2f} | {write_time:>8.3f} | {read_time:>10.3f} | {test_time:>11.3f} | {labels_time:>13.3f} | {rows:>6}')
+    print('-' * 84)
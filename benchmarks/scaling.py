@@ -0,0 +1,103 @@
+import sys
+import json
+import math
+import argparse
+import subprocess
+
+# Usage: python -m benchmarks.scaling -m IndoBERT [--processes 1 2 4 8] [--max_batches 64]
+
+RESULT_PREFIX = 'SCALING_RESULT '
+
+
+def run_child(args):
+    # Imported here so the parent, which only launches and parses, stays light
+    from transformers import AutoTokenizer
+    from pytorch_lightning import Trainer, seed_everything
+    from models.factory import build_model, uses_one_hot_label, pretrained_model_name
+    from utils.preprocessor import TwitterDataModule
+    from utils.runtime import EpochTimer, configure_threads, distributed_options
+
+    configure_threads('auto', 'auto', processes=args.child_processes)
+    seed_everything(42, workers=True)
+
+    pretrained_name = pretrained_model_name.get(args.model, args.model)
+    tokenizer = AutoTokenizer.from_pretrained(pretrained_name, use_fast=False)
+    data_module = TwitterDataModule(tokenizer=tokenizer, max_length=args.max_length, batch_size=args.batch_size, one_hot_label=uses_one_hot_label(args.cnn, args.version), num_workers=0, padding_mode=args.padding_mode)
+    model = build_model(pretrained_name, cnn=args.cnn, version=args.version)
+    epoch_timer = EpochTimer()
+
+    # The global amount of work stays the same, every rank runs its share of max_batches
+    limit_train_batches = math.ceil(args.max_batches / args.child_processes) if args.max_batches is not None else 1.0
+
+    trainer = Trainer(
+        accelerator='cpu',
+        max_epochs=1,
+        limit_train_batches=limit_train_batches,
+        limit_val_batches=0,
+        callbacks=[epoch_timer],
+        logger=False,
+        enable_checkpointing=False,
+        enable_progress_bar=False,
+        enable_model_summary=False,
+        **distributed_options('cpu', devices=args.child_processes, find_unused_parameters=args.cnn)
+    )
+    trainer.fit(model, datamodule=data_module)
+
+    if trainer.is_global_zero:
+        print(RESULT_PREFIX + json.dumps({
+            'processes': args.child_processes,
+            'seconds': epoch_timer.epoch_times[0],
+            'batches_per_rank': trainer.num_training_batches,
+            'rows': trainer.num_training_batches * args.batch_size * args.child_processes,
+        }), flush=True)
+
+
+def run_parent(args):
+    passthrough = ['-m', args.model, '-b', str(args.batch_size), '-l', str(args.max_length), '-v', str(args.version), '--padding_mode', args.padding_mode]
+    if args.cnn:
+        passthrough.append('-c')
+    if args.max_batches is not None:
+        passthrough += ['--max_batches', str(args.max_batches)]
+
+    results = []
+    for processes in args.processes:
+        print(f'[ Training With {processes} Process(es) ]')
+        completed = subprocess.run([sys.executable, '-m', 'benchmarks.scaling', '--child_processes', str(processes)] + passthrough, capture_output=True, text=True)
+        lines = [line for line in completed.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+        if completed.returncode != 0 or len(lines) == 0:
+            print(completed.stdout[-2000:], completed.stderr[-2000:])
+            raise SystemExit(f'Run with {processes} processes failed')
+        results.append(json.loads(lines[-1][len(RESULT_PREFIX):]))
+
+    print()
+    print(f' Model: {args.model} | CNN: {args.cnn} | Version: {args.version} | Batch Size: {args.batch_size} per rank | Max Length: {args.max_length}')
+    print('-' * 78)
+    print(f' {"Processes":<10}| {"Batches/rank":>12} | {"Epoch s":>8} | {"Rows/s":>8} | {"Speedup":>7} | {"Efficiency":>10}')
+    print('-' * 78)
+    baseline = results[0]['rows'] / results[0]['seconds']
+    for result in results:
+        throughput = result['rows'] / result['seconds']
+        speedup = throughput / baseline
+        print(f' {result["processes"]:<10}| {result["batches_per_rank"]:>12} | {result["seconds"]:>8.1f} | {throughput:>8.1f} | {speedup:>6.2f}x | {speedup * results[0]["processes"] / result["processes"]:>10.0%}')
+    print('-' * 78)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='DDP (gloo) CPU training throughput for 1/2/4/8 processes on this host')
+    parser.add_argument('-m', '--model', default='IndoBERT', help='Model name from main.py or a local model path')
+    parser.add_argument('-c', '--cnn', action='store_true', help='Benchmark the CNN head')
+    parser.add_argument('-v', '--version', type=int, choices=[1, 2], default=1, help='Model Version')
+    parser.add_argument('-b', '--batch_size', type=int, default=32, help='Batch size per process')
+    parser.add_argument('-l', '--max_length', type=int, default=128, help='Maximum sequence length')
+    parser.add_argument('--padding_mode', choices=['max_length', 'dynamic'], default='max_length', help='Fixed or length-bucketed dynamic padding')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8], help='Process counts to compare')
+    parser.add_argument('--max_batches', type=int, default=None, help='Global training batches per run, split across the processes')
+    parser.add_argument('--child_processes', type=int, default=None, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child_processes is not None:
+        run_child(args)
+    else:
+        run_parent(args)
@@ -0,0 +1,141 @@
+import time
+import argparse
+import resource
+import threading
+import tracemalloc
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tools.serp import SERP_PARSERS, HttpSerpBackend, SeleniumSerpBackend, get_serp_parser
+from tools.browser_pool import BrowserPool
+
+# Usage: python -m benchmarks.serp [--fixture saved_serp.html] [--repeat 20] [--queries 10] [--selenium]
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (benchmark)'}
+
+RESULT = """<div class="MjjYud"><div class="g"><div><a jsname="UWckNb" href="https://news{index}.example.com/article/{index}">
+<h3 class="LC20lb MBeuO DKV0Md">Result title {index} about the claim</h3></a>
+<div><span>News Site {index}</span><cite>https://news{index}.example.com › article › {index}</cite></div></div>
+<div class="VwiC3b"><span>Snippet {index} of the search result with a few words of the article and the date.</span></div></div></div>"""
+
+
+def make_fixture(results, filler_kb):
+    # Shaped like a Google result page, which is mostly inline script and style around a few result blocks
+    filler = "<script>var state = '" + "x" * 1024 + "';</script>\n"
+    blocks = "\n".join(RESULT.format(index = index) for index in range(results))
+    return f"<html><head><style>.g{{margin:0}}</style>{filler * (filler_kb // 2)}</head><body><div id=\"search\">{blocks}</div>{filler * (filler_kb // 2)}</body></html>"
+
+
+def start_fixture_server(html, delay):
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            time.sleep(delay)
+            body = html.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+
+def median_ms(function, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return sorted(seconds)[len(seconds) // 2] * 1000
+
+
+def peak_kb(function):
+    # Python heap only, the C parsers' own trees (libxml2, lexbor) do not show up here
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def children_rss_mb():
+    # Largest RSS of any finished child process, the browser and its driver once they have quit
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='SERP parser and backend latency / memory on a saved or synthetic result page')
+    parser.add_argument('--fixture', default=None, help='Saved result page html, e.g. a dumped driver.page_source, a synthetic one otherwise')
+    parser.add_argument('--results', type=int, default=10, help='Result blocks in the synthetic page')
+    parser.add_argument('--filler_kb', type=int, default=800, help='Inline script in the synthetic page, real ones are close to 1MB')
+    parser.add_argument('--max_results', type=int, default=5, help='max_content_search, results read per page')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed parses per parser')
+    parser.add_argument('--queries', type=int, default=10, help='Result pages fetched per backend')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds the fixture server waits before answering')
+    parser.add_argument('--selenium', action='store_true', help='Also time the headless Chrome backend, needs Chrome and chromedriver')
+
+    args = parser.parse_args()
+
+    if args.fixture is not None:
+        with open(args.fixture, encoding = 'utf-8') as file:
+            html = file.read()
+    else:
+        html = make_fixture(args.results, args.filler_kb)
+
+    reference = SERP_PARSERS['bs4'](html, args.max_results)
+
+    print()
+    print(f' Page: {args.fixture or "synthetic"} | {len(html) / 1024:.0f} KB | Hits read: {len(reference)}')
+    print('-' * 67)
+    print(f' {"Parser":<12}| {"Parse ms":>9} | {"Py peak KB":>10} | {"Speedup":>7} | {"Same hits":>9}')
+    print('-' * 67)
+    parse_results = []
+    for name in SERP_PARSERS:
+        parse = get_serp_parser(name)
+        milliseconds = median_ms(lambda: parse(html, args.max_results), args.repeat)
+        parse_results.append((name, milliseconds, peak_kb(lambda: parse(html, args.max_results)), parse(html, args.max_results) == reference))
+    for name, milliseconds, kilobytes, same in parse_results:
+        print(f' {name:<12}| {milliseconds:>9.2f} | {kilobytes:>10.0f} | {parse_results[0][1] / milliseconds:>6.2f}x | {str(same):>9}')
+    print('-' * 67)
+
+    server = start_fixture_server(html, args.delay)
+    url = f"http://127.0.0.1:{server.server_address[1]}/search?q=claim"
+    parse = get_serp_parser('lxml')
+
+    backends = [('http', lambda: HttpSerpBackend(headers = HEADERS))]
+    if args.selenium:
+        backends.append(('selenium', lambda: SeleniumSerpBackend(BrowserPool(size = 1))))
+
+    backend_results = []
+    for name, build in backends:
+        start = time.perf_counter()
+        try:
+            backend = build()
+            backend.fetch(url)
+        except Exception as error:
+            print(f'[ {name} backend unavailable: {error} ]')
+            continue
+        startup = time.perf_counter() - start
+
+        milliseconds = median_ms(lambda: parse(backend.fetch(url), args.max_results), args.queries)
+        kilobytes = peak_kb(lambda: parse(backend.fetch(url), args.max_results))
+        backend.close()
+        backend_results.append((name, startup * 1000, milliseconds, kilobytes, children_rss_mb()))
+
+    server.shutdown()
+
+    print()
+    print(f' Backends, fetch + lxml parse of the same page from a local server ({args.delay}s delay)')
+    print('-' * 75)
+    print(f' {"Backend":<10}| {"First page ms":>13} | {"Query ms":>9} | {"Py peak KB":>10} | {"Child RSS MB":>12}')
+    print('-' * 75)
+    for name, startup, milliseconds, kilobytes, rss in backend_results:
+        print(f' {name:<10}| {startup:>13.0f} | {milliseconds:>9.1f} | {kilobytes:>10.0f} | {rss:>12.0f}')
+    print('-' * 75)
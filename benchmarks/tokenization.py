@@ -0,0 +1,55 @@
+import time
+import argparse
+
+from transformers import AutoTokenizer
+from models.factory import pretrained_model_name
+from utils.preprocessor import TwitterDataModule
+from utils.tokenization import encode_slow, encode_batched
+
+# Usage: python -m benchmarks.tokenization [-m IndoBERT IndoRoBERTa_OSCAR ...] [-l 128]
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Slow vs batched fast tokenizer benchmark')
+    parser.add_argument('-m', '--models', nargs='+', default=list(pretrained_model_name.keys()), help='Model names from main.py or tokenizer paths')
+    parser.add_argument('-l', '--max_length', type=int, default=128, help='Maximum sequence length')
+    parser.add_argument('--limit', type=int, default=None, help='Only tokenize the first N rows')
+    parser.add_argument('--chunk_size', type=int, default=2048, help='Rows per fast tokenizer call')
+
+    args = parser.parse_args()
+
+    # Cleaning does not depend on the tokenizer, so do it once for all models
+    first_tokenizer = AutoTokenizer.from_pretrained(pretrained_model_name.get(args.models[0], args.models[0]), use_fast=False)
+    dataset = TwitterDataModule(tokenizer=first_tokenizer, max_length=args.max_length, recreate=True, cache_dir=None).load_processed_dataset()
+    texts = [f"{Headline} [SEP] {text}" for text, Headline in zip(dataset['text'], dataset['Headline'])]
+    if args.limit is not None:
+        texts = texts[:args.limit]
+
+    results = []
+    for model_name in args.models:
+        slow_tokenizer = AutoTokenizer.from_pretrained(pretrained_model_name.get(model_name, model_name), use_fast=False)
+        fast_tokenizer = AutoTokenizer.from_pretrained(pretrained_model_name.get(model_name, model_name), use_fast=True)
+
+        start = time.perf_counter()
+        slow_input_ids, slow_attention_mask = encode_slow(slow_tokenizer, texts, args.max_length)
+        slow_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast_input_ids, fast_attention_mask = encode_batched(fast_tokenizer, texts, args.max_length, chunk_size=args.chunk_size)
+        fast_time = time.perf_counter() - start
+
+        mismatch = (slow_input_ids != fast_input_ids).any(dim=1) | (slow_attention_mask != fast_attention_mask).any(dim=1)
+
+        results.append((model_name, len(texts) / slow_time, len(texts) / fast_time, int(mismatch.sum())))
+
+    print()
+    print(f' Rows: {len(texts)} | Max Length: {args.max_length}')
+    print('-' * 78)
+    print(f' {"Model":<22}| {"Slow rows/s":>12} | {"Fast rows/s":>12} | {"Speedup":>8} | {"Mismatch":>8}')
+    print('-' * 78)
+    for model_name, slow_rps, fast_rps, mismatches in results:
+        print(f' {model_name:<22}| {slow_rps:>12.1f} | {fast_rps:>12.1f} | {fast_rps / slow_rps:>7.1f}x | {mismatches:>8}')
+    print('-' * 78)
+
+    if any(mismatches > 0 for *_, mismatches in results):
+        raise SystemExit('Fast tokenizer output differs from the slow path, keep --tokenize_mode slow for those models')
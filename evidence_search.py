@@ -19,13 +19,19 @@ from selenium.webdriver.support import expected_conditions as EC
 
 # import eventlet
 
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 
 from googlesearch import search
-import trafilatura
 
 from tools.evidence_ranker import EvidenceRanker
+from tools.fetcher import PageFetcher
+from tools.browser_pool import BrowserPool, headless_chrome
+from tools.evidence_writer import EvidenceWriter, completed_claims
+from tools.http_cache import ResponseCache
+from tools.serp import HttpSerpBackend, SeleniumSerpBackend, get_serp_parser
+
+from concurrent.futures import ThreadPoolExecutor
+from selenium.common.exceptions import WebDriverException
 
 class EvidenceSearch():
     
@@ -34,12 +40,24 @@ class EvidenceSearch():
                  pages = 1,
                  max_query_search = 100,
                  max_content_search = 5,
-                 sort_by = "evidence_query"):
+                 sort_by = "evidence_query",
+                 fetch_workers = 8,
+                 per_host_limit = 2,
+                 fetch_deadline = 30,
+                 extract_workers = None,
+                 browser_workers = 1,
+                 recycle_after = 50,
+                 page_timeout = 30,
+                 cache_dir = "datasets/cache/evidence",
+                 cache_ttl = 7 * 24 * 3600,
+                 cache_max_bytes = 2 * 1024 ** 3,
+                 offline = False,
+                 serp_backend = "http",
+                 serp_parser = "lxml"):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/71.0.3578.98 Safari/537.36 OPR/58.0.3135.79'}
         self.lang = lang
         self.pages = pages
-        self.threadLocal = threading.local()
         
         self.max_query_search = max_query_search
         self.max_content_search = max_content_search
@@ -49,17 +67,48 @@ class EvidenceSearch():
         
         self.evidence_ranker = EvidenceRanker(selection_max_len = 512)
         
+        # Result pages of one query are downloaded together, fetch_deadline bounds the whole batch
+        self.fetcher = PageFetcher(headers = self.headers,
+                                   timeout = self.timeout,
+                                   workers = fetch_workers,
+                                   per_host = per_host_limit,
+                                   deadline = fetch_deadline,
+                                   extract_workers = extract_workers)
+        
+        # browser_workers queries of a claim are searched at once, each one leasing a browser from the pool for its SERP page
+        self.browser_workers = browser_workers
+        self.browser_pool = BrowserPool(size = browser_workers,
+                                        recycle_after = recycle_after,
+                                        page_timeout = page_timeout,
+                                        factory = self.get_driver)
+        self.query_pool = ThreadPoolExecutor(max_workers = browser_workers)
+        
+        # serp_backend = "http" reads result pages with plain requests and only starts a browser when a page comes back
+        # without results (consent page, JavaScript-only layout), "selenium" always uses the browsers
+        self.serp_backends = [SeleniumSerpBackend(self.browser_pool)]
+        if serp_backend == "http":
+            self.serp_backends.insert(0, HttpSerpBackend(headers = self.headers, timeout = self.timeout, pool_size = browser_workers))
+        self.parse_serp = get_serp_parser(serp_parser)
+        
+        # SERP html and extracted pages are kept on disk, offline = True replays them and never touches the network
+        if offline and cache_dir is None:
+            raise ValueError("offline mode replays the cache, it needs a cache_dir")
+        self.offline = offline
+        self.cache = ResponseCache(cache_dir, ttl = cache_ttl, max_bytes = cache_max_bytes, offline = offline) if cache_dir is not None else None
         
-    def get_driver(self):
-        driver = getattr(self.threadLocal, 'driver', None)
-
-        if driver is None:
-            chromeOptions = webdriver.ChromeOptions()
-            chromeOptions.add_argument('--headless=new')
-            driver = webdriver.Chrome(options=chromeOptions)
-            setattr(self.threadLocal, 'driver', driver)
         
-        return driver
+    def get_driver(self):
+        # A new browser for the pool, which owns it from then on and quits it when recycling or closing
+        return headless_chrome()
+    
+    def close(self):
+        self.query_pool.shutdown(wait = False, cancel_futures = True)
+        for backend in self.serp_backends:
+            backend.close()
+        self.fetcher.close()
+        if self.cache is not None:
+            print(self.cache.stats())
+            self.cache.close()
 
     
     def clean_str(self, string):
@@ -72,80 +121,74 @@ class EvidenceSearch():
         return string
     
     def visit_content(self, target_url):
-        try:
-            page_raw = requests.get(target_url, headers = self.headers, timeout = self.timeout, verify=False)
-            
-            if page_raw.status_code == 400:
+        return self.visit_contents([target_url])[0]
+    
+    def visit_contents(self, target_urls):
+        page_contents = [None] * len(target_urls)
+        if self.cache is not None:
+            page_contents = [self.cache.get("page", target_url, self.lang) for target_url in target_urls]
+        
+        missing = [index for index, page_content in enumerate(page_contents) if page_content is None]
+        if self.offline:
+            fetched = [{} for _ in missing]
+        else:
+            fetched = self.fetcher.fetch_all([target_urls[index] for index in missing])
+        
+        for index, page_content in zip(missing, fetched):
+            page_contents[index] = page_content
+            # Failed pages are not stored, the next run tries them again
+            if self.cache is not None and len(page_content) > 0:
+                self.cache.put("page", target_urls[index], self.lang, page_content)
+        
+        return page_contents
+    
+    def fetch_serp(self, url):
+        # The first backend whose page has results wins, the last one (Selenium) is the fallback
+        for backend in self.serp_backends:
+            try:
+                page_source = backend.fetch(url)
+            except (requests.RequestException, WebDriverException):
+                # A slow or failed SERP page only loses this backend's try for this query
                 print("timeout")
-                print(target_url)
-                page_content = {}
-            else:
-                page_content = trafilatura.bare_extraction(page_raw.text)
-                page_content = {
-                    "date": page_content["date"],
-                    "author": page_content["author"],
-                    "text": page_content["text"],
-                    "language": page_content["language"],
-                    "url": page_content["url"],
-                    "hostname": page_content["hostname"],
-                }
-        except:
-            # logging.error("Time out!")
+                print(url)
+                continue
             
-            print("timeout")
-            print(target_url)
-            page_content = {}
+            hits = self.parse_serp(page_source, self.max_content_search)
+            if len(hits) > 0 or backend is self.serp_backends[-1]:
+                return page_source, hits
         
-        
-        return page_content
+        return None, []
     
     def fetch_content(self, url, claim, query):
         contents_data = []
         
-        driver = self.get_driver()
-        driver.get(url)
-        
-        contents = BeautifulSoup(driver.page_source, "html.parser")
+        page_source = self.cache.get("serp", url, self.lang) if self.cache is not None else None
+        if page_source is not None:
+            hits = self.parse_serp(page_source, self.max_content_search)
+        elif self.offline:
+            return contents_data
+        else:
+            page_source, hits = self.fetch_serp(url)
+            
+            # Only pages with results are kept, a consent or captcha page is fetched again next time
+            if self.cache is not None and len(hits) > 0:
+                self.cache.put("serp", url, self.lang, page_source)
         
-        search_highlight = ""
-        highlights = contents.find_all("span", attrs={"class": "hgKElc"})
+        hits = [{**hit, "lang": self.lang, "query": query} for hit in hits]
         
-        # if len(highlights) > 0:
-        #     search_highlight = highlights[0].text
+        # Every hit is downloaded at once instead of one blocking request after another
+        searched_contents = self.visit_contents([meta_data["source_url"] for meta_data in hits])
         
-        for i_cts, cts in enumerate(contents.find_all("div", attrs={'class': 'MjjYud'})):
-            title = cts.find_all("h3", attrs={'class': 'DKV0Md'})
+        for meta_data, searched_content in zip(hits, searched_contents):
+            if len(searched_content) < 1:
+                continue
             
-            if len(title) > 0:
-                title = title[0].text
-                url = cts.find("cite")
-                root_url = url.text.split(" › ")[0]
-                source = cts.find_all("span")[0].text
-                source_url = cts.find_all("a", attrs={"jsname": "UWckNb"})[0]["href"]
-                
-                searched_content = self.visit_content(source_url)
-                
-                if len(searched_content) < 1:
-                    continue
-                
-                evidence_scores = self.evidence_ranker.compute_evidence_score_piece(evidence = searched_content["text"],
-                                                                                    claim = claim,
-                                                                                    query = query)
-                
-                meta_data = {
-                    "title": title,
-                    "root_url": root_url,
-                    "source": source,
-                    "source_url": source_url,
-                    "lang": self.lang,
-                    "query": query,
-                }
-                final_data = {**meta_data, **searched_content, **evidence_scores}
-                contents_data.append(final_data)
-
+            evidence_scores = self.evidence_ranker.compute_evidence_score_piece(evidence = searched_content["text"],
+                                                                                claim = claim,
+                                                                                query = query)
             
-            if i_cts >= self.max_content_search:
-                break
+            final_data = {**meta_data, **searched_content, **evidence_scores}
+            contents_data.append(final_data)
         
         if self.sort_by == "claim_evidence":
             contents_data = sorted(contents_data, key=lambda contents_data: contents_data['evidence_claim_score'], reverse = True)
@@ -173,14 +216,17 @@ class EvidenceSearch():
 
     def search(self, queries, claim, context = None):
         datas = []
+        claim_context = claim
         if context:
             claim_context = claim + context
             claim_context = claim_context.strip().split(". ")
             claim_context = ". ".join(claim_context[:5])
         
-        for i_query, query in enumerate(queries):
-            evidence = self.search_piece(query = query["query"], claim = claim_context)
-            
+        # At most max_query_search queries per claim, in the order given, spread over the browser workers and kept in order
+        queries = queries[:self.max_query_search]
+        evidences = self.query_pool.map(lambda query: self.search_piece(query = query["query"], claim = claim_context), queries)
+        
+        for query, evidence in zip(queries, evidences):
             datas.append({
                 "query": query["query"],
                 "query_score": query["query_score"],
@@ -188,8 +234,6 @@ class EvidenceSearch():
                 "context": context,
                 "evidence": evidence
             })    
-            if i_query > self.max_query_search:
-                break
             
         return datas
     
@@ -202,26 +246,37 @@ class EvidenceSearch():
         return txt_translated.strip()
     
 
-    def verify_claim(self):
+    def search_claims(self, datasets):
+        # Yields (data, results) one claim after another. Each claim's queries run side by side on query_pool, so no
+        # claim's queries wait behind another claim's, and a finished claim is written before the next one starts.
+        for data in datasets:
+            yield data, self.search(data["queries"], claim = data["claim"], context = data["context"])
+
+    def verify_claim(self,
+                     output_path = "datasets/MMCoVaR/MMCoVaR_News_search_queries_evidence.jsonl",
+                     resume = True,
+                     checkpoint_every = 10):
         with open('datasets/MMCoVaR/MMCoVaR_News_search_queries_retry.json', 'r') as f_read:
             datasets = json.load(f_read)
         
-        overall = []
+        datasets = [data for data in datasets if len(data["queries"]) > 0]
+        
+        # One line per claim appended to output_path, resume skips every claim already in it
+        if resume:
+            done = completed_claims(output_path)
+            datasets = [data for data in datasets if data["claim"] not in done]
+        elif os.path.exists(output_path):
+            os.remove(output_path)
         
-        for data in tqdm(datasets):
-            if len(data["queries"]) > 0:
-                results = self.search(data["queries"])
-                overall.append({
+        with EvidenceWriter(output_path, checkpoint_every = checkpoint_every) as writer:
+            for data, results in tqdm(self.search_claims(datasets), total = len(datasets)):
+                writer.write({
                     "claim": data["claim"],
                     "context": data["context"],
                     "queries": data["queries"],
                     "evidence": results
                 })
-                
-                with open(f"datasets/MMCoVaR/MMCoVaR_News_search_queries_evidence.json", "w") as w_json:
-                    json.dump(overall, w_json, indent = 4)   
                     
-                # print(overall)
                 # print(results[0].keys())
                 # print("="*20)
                 # sys.exit()
@@ -230,7 +285,10 @@ if __name__ == '__main__':
     
     Stool = EvidenceSearch(lang = "en", pages = 1)
     # Stool.search(keyword = "What is the second iteration of CBS' Late Show franchise?")
-    Stool.verify_claim()
+    try:
+        Stool.verify_claim()
+    finally:
+        Stool.close()
     
     # test = list(search("covid19", advanced=True, num_results = 10, sleep_interval = 5))
     # print(test[0])
\ No newline at end of file
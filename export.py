@@ -0,0 +1,161 @@
+import os
+import time
+import argparse
+import torch
+import pandas as pd
+
+from torch import nn
+from sklearn.metrics import accuracy_score, f1_score
+from inference import InferenceEngine, find_checkpoint, parse_run_name
+
+# Usage: python export.py -c checkpoints/IndoBERT_version1 [--data datasets/test.csv] [-o exports]
+
+ONNX_OPSET = 14
+
+
+class ProbabilityModule(nn.Module):
+
+    # ONNX only traces forward, this routes it through predict_proba so the export ends at the probability
+    def __init__(self, model) -> None:
+        super(ProbabilityModule, self).__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.predict_proba(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class OnnxModel():
+
+    def __init__(self, onnx_path, num_threads=None) -> None:
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+    def predict_proba(self, input_ids, attention_mask):
+        probability, = self.session.run(['probability'], {
+            'input_ids': input_ids.numpy().astype('int64'),
+            'attention_mask': attention_mask.numpy().astype('int64'),
+        })
+        return torch.from_numpy(probability)
+
+
+def export_onnx(model, onnx_path, max_length=128, cnn=False):
+    model = ProbabilityModule(model).eval()
+    sample = (torch.ones((2, max_length), dtype=torch.long), torch.ones((2, max_length), dtype=torch.long))
+
+    # The CNN heads max-pool over the full max_length, so only the batch axis stays dynamic for them
+    dynamic_axes = {'input_ids': {0: 'batch'}, 'attention_mask': {0: 'batch'}, 'probability': {0: 'batch'}}
+    if not cnn:
+        dynamic_axes['input_ids'][1] = 'sequence'
+        dynamic_axes['attention_mask'][1] = 'sequence'
+
+    options = dict(input_names=['input_ids', 'attention_mask'], output_names=['probability'], dynamic_axes=dynamic_axes, opset_version=ONNX_OPSET)
+
+    os.makedirs(os.path.dirname(onnx_path) or '.', exist_ok=True)
+    with torch.no_grad():
+        try:
+            torch.onnx.export(model, sample, onnx_path, dynamo=False, **options)
+        except TypeError:
+            # torch < 2.5 has no dynamo argument and always uses the TorchScript exporter
+            torch.onnx.export(model, sample, onnx_path, **options)
+
+    return onnx_path
+
+
+def quantize_onnx(onnx_path, quantized_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+def single_item_latency(engine, items, repeat=50):
+    latencies = []
+    for item in items[:repeat]:
+        start = time.perf_counter()
+        engine.predict([item])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return sorted(latencies)[len(latencies) // 2]
+
+
+def evaluate(engine, items, labels, latency_items):
+    engine.total_items, engine.total_seconds = 0, 0.0
+    predictions = [result['label'] for result in engine.predict(items)]
+
+    return {
+        'accuracy': accuracy_score(labels, predictions),
+        'f1': f1_score(labels, predictions),
+        'throughput': engine.throughput(),
+        'latency_ms': single_item_latency(engine, items, repeat=latency_items),
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='INT8 and ONNX export of a trained checkpoint with an accuracy vs latency report')
+    parser.add_argument('-c', '--checkpoint', required=True, help='Checkpoint file or run directory under ./checkpoints')
+    parser.add_argument('-m', '--model', default=None, help='Model name from main.py, read from the run directory when omitted')
+    parser.add_argument('--cnn', action='store_true', help='Checkpoint has a CNN head, only used together with --model')
+    parser.add_argument('-v', '--version', type=int, choices=[1, 2], default=1, help='Model Version, only used together with --model')
+    parser.add_argument('-o', '--output', default='exports', help='Directory for the exported ONNX files')
+    parser.add_argument('-d', '--data', default='datasets/test.csv', help='Labelled CSV for the report')
+    parser.add_argument('--limit', type=int, default=None, help='Only score the first N rows')
+    parser.add_argument('-b', '--batch_size', type=int, default=32, help='Batch size')
+    parser.add_argument('-l', '--max_length', type=int, default=128, help='Maximum sequence length')
+    parser.add_argument('--latency_items', type=int, default=50, help='Single item requests for the p50 latency')
+    parser.add_argument('-t', '--num_threads', type=int, default=None, help='torch and ONNX Runtime intra-op threads')
+
+    args = parser.parse_args()
+
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+
+    checkpoint_path = find_checkpoint(args.checkpoint)
+    if args.model is None:
+        model_name, cnn, version = parse_run_name(checkpoint_path)
+    else:
+        model_name, cnn, version = args.model, args.cnn, args.version
+
+    options = dict(model_name=model_name, cnn=cnn, version=version, max_length=args.max_length, batch_size=args.batch_size)
+    fp32_engine = InferenceEngine.from_checkpoint(checkpoint_path, **options)
+    int8_engine = InferenceEngine.from_checkpoint(checkpoint_path, quantize=True, **options)
+
+    run_name = f"{os.path.basename(model_name.rstrip('/'))}{'_CNN' if cnn else ''}_version{version}"
+    onnx_path = export_onnx(fp32_engine.model, os.path.join(args.output, run_name, 'model.onnx'), max_length=args.max_length, cnn=cnn)
+    onnx_int8_path = quantize_onnx(onnx_path, os.path.join(args.output, run_name, 'model.int8.onnx'))
+    print(f'[ Exported {onnx_path} and {onnx_int8_path} ]')
+
+    # The ONNX engines reuse the tokenizer and padding of the torch one, only the model is swapped
+    engine_options = dict(max_length=args.max_length, batch_size=args.batch_size, padding=fp32_engine.padding)
+    variants = [
+        ('torch fp32', fp32_engine, checkpoint_path),
+        ('torch int8', int8_engine, None),
+        ('onnx fp32', InferenceEngine(OnnxModel(onnx_path, args.num_threads), fp32_engine.tokenizer, **engine_options), onnx_path),
+        ('onnx int8', InferenceEngine(OnnxModel(onnx_int8_path, args.num_threads), fp32_engine.tokenizer, **engine_options), onnx_int8_path),
+    ]
+
+    dataset = pd.read_csv(args.data)
+    if args.limit is not None:
+        dataset = dataset.head(args.limit)
+    items = list(zip(dataset['Headline'].astype(str), dataset['text'].fillna('').astype(str)))
+    labels = dataset['label'].astype(int).tolist()
+
+    results = [(name, evaluate(engine, items, labels, args.latency_items), path) for name, engine, path in variants]
+    baseline_f1 = results[0][1]['f1']
+
+    print()
+    print(f' Rows: {len(items)} | Max Length: {args.max_length} | Batch Size: {args.batch_size} | Threads: {torch.get_num_threads()}')
+    print('-' * 86)
+    print(f' {"Variant":<11}| {"Accuracy":>8} | {"F1":>6} | {"F1 loss":>7} | {"Items/s":>8} | {"p50 ms":>7} | {"Speedup":>7} | {"Size MB":>7}')
+    print('-' * 86)
+    for name, metrics, path in results:
+        size = f'{os.path.getsize(path) / 2 ** 20:>7.1f}' if path is not None else f'{"-":>7}'
+        speedup = metrics['throughput'] / results[0][1]['throughput']
+        print(f' {name:<11}| {metrics["accuracy"]:>8.4f} | {metrics["f1"]:>6.4f} | {baseline_f1 - metrics["f1"]:>7.4f} | {metrics["throughput"]:>8.1f} | {metrics["latency_ms"]:>7.1f} | {speedup:>6.2f}x | {size}')
+    print('-' * 86)
@@ -0,0 +1,186 @@
+import os
+import re
+import glob
+import time
+import argparse
+import torch
+import pandas as pd
+
+from torch import nn
+from transformers import AutoTokenizer
+from Sastrawi.StopWordRemover.StopWordRemoverFactory import StopWordRemoverFactory
+from models.factory import build_model, pretrained_model_name
+from utils.cleaner import clean_text_series
+
+# main.py names runs {model_name}{_CNN}_version{version}/{batch_size}_{learning_rate}
+RUN_NAME_PATTERN = re.compile(r'^(?P<model>.+?)(?P<cnn>_CNN)?_version(?P<version>[12])$')
+
+
+def find_checkpoint(path):
+    if os.path.isfile(path):
+        return path
+
+    checkpoints = [checkpoint for checkpoint in glob.glob(os.path.join(path, '**', '*.ckpt'), recursive=True) if os.path.basename(checkpoint) != 'last.ckpt']
+    if len(checkpoints) == 0:
+        raise FileNotFoundError(f'No checkpoint found under {path}')
+
+    if len(checkpoints) == 1:
+        return checkpoints[0]
+
+    # A model directory holds one {batch_size}_{learning_rate} run per sweep point, the newest file is only the run that trained last
+    scores = {checkpoint: checkpoint_score(checkpoint) for checkpoint in checkpoints}
+    if all(score is not None for score in scores.values()):
+        return max(checkpoints, key=scores.get)
+
+    if len({os.path.dirname(checkpoint) for checkpoint in checkpoints}) > 1:
+        raise ValueError(f'{path} holds checkpoints of several runs and not all of them store a ModelCheckpoint score, pass the .ckpt file itself')
+
+    # ModelCheckpoint only keeps the best one of a run and replaces it on every improvement, so the newest file is the best
+    return max(checkpoints, key=os.path.getmtime)
+
+
+def checkpoint_score(checkpoint_path):
+    # best_model_score ModelCheckpoint stored in the file, negated for mode='min' so higher is always better
+    try:
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', mmap=True, weights_only=False)
+    except TypeError:
+        # torch < 2.1 has no mmap argument
+        checkpoint = load_checkpoint(checkpoint_path)
+
+    for key, state in checkpoint.get('callbacks', {}).items():
+        if 'ModelCheckpoint' in str(key) and state.get('best_model_score') is not None:
+            score = float(state['best_model_score'])
+            return -score if "'mode': 'min'" in str(key) else score
+
+    return None
+
+
+def parse_run_name(checkpoint_path):
+    for part in reversed(os.path.normpath(checkpoint_path).split(os.sep)):
+        match = RUN_NAME_PATTERN.match(part)
+        if match:
+            return match['model'], match['cnn'] is not None, int(match['version'])
+
+    raise ValueError(f'Cannot tell the model, CNN and version from {checkpoint_path}, pass them explicitly')
+
+
+def load_checkpoint(checkpoint_path):
+    try:
+        return torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+    except TypeError:
+        # torch < 1.13 has no weights_only argument
+        return torch.load(checkpoint_path, map_location='cpu')
+
+
+class InferenceEngine():
+
+    # model is anything with predict_proba(input_ids, attention_mask), a Finetune module or an OnnxModel from export.py
+    def __init__(self, model, tokenizer, max_length=128, batch_size=32, padding='max_length') -> None:
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.padding = padding
+        self.stop_words = StopWordRemoverFactory().get_stop_words()
+
+        self.total_items = 0
+        self.total_seconds = 0.0
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint_path, model_name=None, cnn=None, version=None, quantize=False, hidden_states='top_k', compile_model=False, **kwargs):
+        checkpoint_path = find_checkpoint(checkpoint_path)
+        if model_name is None:
+            model_name, cnn, version = parse_run_name(checkpoint_path)
+
+        # Only the architecture is built, the weights all come from the checkpoint
+        pretrained_name = pretrained_model_name.get(model_name, model_name)
+        model = build_model(pretrained_name, cnn=cnn, version=version, pretrained=False, hidden_states=hidden_states, compile_model=compile_model)
+        model.load_state_dict(load_checkpoint(checkpoint_path)['state_dict'])
+        model = model.to('cpu').eval()
+
+        if quantize:
+            # INT8 weights for every Linear layer, activations are quantized on the fly per batch
+            model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+        tokenizer = AutoTokenizer.from_pretrained(pretrained_name, use_fast=False)
+
+        # The CNN heads max-pool over padded positions too, so they need the same max_length padding as in training
+        kwargs.setdefault('padding', 'max_length' if cnn else 'longest')
+
+        print(f'[ Loaded {checkpoint_path} ]')
+
+        return cls(model, tokenizer, **kwargs)
+
+    def preprocess(self, items):
+        # Same cleaning and Headline [SEP] text composition as TwitterDataModule, only the text is cleaned
+        headlines = [headline for headline, _ in items]
+        texts = clean_text_series(pd.Series([text for _, text in items], dtype=object), self.stop_words).fillna('')
+
+        return [f"{Headline} [SEP] {text}" for Headline, text in zip(headlines, texts)]
+
+    def encode(self, texts):
+        encoded_text = self.tokenizer(
+            texts,
+            max_length=self.max_length,
+            padding=self.padding,
+            truncation=True,
+            return_tensors='pt'
+        )
+        return encoded_text['input_ids'], encoded_text['attention_mask']
+
+    def predict(self, items):
+        start = time.perf_counter()
+        texts = self.preprocess(items)
+
+        probabilities = []
+        with torch.inference_mode():
+            for batch_start in range(0, len(texts), self.batch_size):
+                input_ids, attention_mask = self.encode(texts[batch_start:batch_start + self.batch_size])
+                probabilities += self.model.predict_proba(input_ids=input_ids, attention_mask=attention_mask).float().tolist()
+
+        self.total_items += len(items)
+        self.total_seconds += time.perf_counter() - start
+
+        return [{'probability': probability, 'label': int(probability >= 0.5)} for probability in probabilities]
+
+    def throughput(self):
+        return self.total_items / self.total_seconds if self.total_seconds > 0 else 0.0
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Batched CPU inference from a trained checkpoint')
+    parser.add_argument('-c', '--checkpoint', required=True, help='Checkpoint file or run directory under ./checkpoints')
+    parser.add_argument('-i', '--input', required=True, help='CSV with Headline and text columns')
+    parser.add_argument('-o', '--output', default=None, help='Write the input plus probability and label columns to this CSV')
+    parser.add_argument('-m', '--model', default=None, help='Model name from main.py, read from the run directory when omitted')
+    parser.add_argument('--cnn', action='store_true', help='Checkpoint has a CNN head, only used together with --model')
+    parser.add_argument('-v', '--version', type=int, choices=[1, 2], default=1, help='Model Version, only used together with --model')
+    parser.add_argument('-b', '--batch_size', type=int, default=32, help='Batch size')
+    parser.add_argument('-l', '--max_length', type=int, default=128, help='Maximum sequence length')
+    parser.add_argument('-t', '--num_threads', type=int, default=None, help='torch intra-op threads')
+    parser.add_argument('-q', '--quantize', action='store_true', help='Dynamic INT8 quantization of the Linear layers')
+    parser.add_argument('--compile', action='store_true', help='torch.compile the forward and use SDPA attention, falls back to eager when unavailable')
+
+    args = parser.parse_args()
+
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+
+    if args.model is None:
+        engine = InferenceEngine.from_checkpoint(args.checkpoint, quantize=args.quantize, compile_model=args.compile, max_length=args.max_length, batch_size=args.batch_size)
+    else:
+        engine = InferenceEngine.from_checkpoint(args.checkpoint, model_name=args.model, cnn=args.cnn, version=args.version, quantize=args.quantize, compile_model=args.compile, max_length=args.max_length, batch_size=args.batch_size)
+
+    dataset = pd.read_csv(args.input)
+    results = engine.predict(list(zip(dataset['Headline'].astype(str), dataset['text'].fillna('').astype(str))))
+
+    dataset['probability'] = [result['probability'] for result in results]
+    dataset['prediction'] = [result['label'] for result in results]
+
+    if args.output is not None:
+        dataset.to_csv(args.output, index=False)
+    else:
+        print(dataset[['Headline', 'probability', 'prediction']].to_string())
+
+    print(f'\n[ {engine.total_items} Items In {engine.total_seconds:.2f}s, {engine.throughput():.1f} Items/s ]')
@@ -1,32 +1,183 @@
 import os
 import sys
+import json
+import runpy
 import argparse
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
-from transformers import AutoTokenizer, AutoModel, AutoModelForSequenceClassification
-from pytorch_lightning import Trainer, seed_everything
-from pytorch_lightning.callbacks import ModelCheckpoint, TQDMProgressBar, EarlyStopping
-from pytorch_lightning.loggers import TensorBoardLogger, CSVLogger
-from utils.preprocessor import TwitterDataModule
-from models.finetune import FinetuneV1, FinetuneV2
-from models.finetune_with_cnn import FinetuneWithCNNv1, FinetuneWithCNNv2
 from textwrap import dedent
 
+# torch, transformers and lightning are only imported inside the commands, so --help and config checks return without loading them
 
-if __name__ == '__main__':
+# Usage:
+#   python main.py train -m IndoBERT --cnn -v 2
+#   python main.py train --config runs.yaml [--check]
+#   python main.py test -c checkpoints/IndoBERT_CNN_version2
+#   python main.py predict -c checkpoints/IndoBERT_version1 -i datasets/test.csv   (inference.py arguments)
+#   python main.py export -c checkpoints/IndoBERT_version1                        (export.py arguments)
+#   python main.py bench padding -m IndoBERT                                       (benchmarks/<name>.py arguments)
 
-    seed_everything(seed=42, workers=True)
+MODEL_NAMES = ['IndoBERT', 'IndoBERTweet', 'IndoRoBERTa_OSCAR', 'IndoRoBERTa_Wiki']
+
+# Commands that hand their arguments to an existing script as they are
+FORWARDED_SCRIPTS = {'predict': 'inference', 'export': 'export'}
+
+BENCHMARKS = sorted(os.path.splitext(name)[0] for name in os.listdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')) if name.endswith('.py') and not name.startswith('_'))
 
-    parser = argparse.ArgumentParser(description='Trainer Parser')
-    parser.add_argument('-m', '--model', choices=['IndoBERT', 'IndoBERTweet', 'IndoRoBERTa_OSCAR', 'IndoRoBERTa_Wiki'], required=True, help='Pretrinaed model choices to train')
-    parser.add_argument('-lr', '--learning_rate', type=float, default=2e-5, help='Learning rate')
+
+def add_runtime_arguments(parser):
+    parser.add_argument('--accelerator', choices=['auto', 'cpu', 'gpu'], default='auto', help="Training device, 'auto' uses the GPU when CUDA is available")
+    parser.add_argument('--precision', choices=['32', 'bf16'], default='32', help='fp32 or bf16 autocast training, bf16 also works on CPU')
+    parser.add_argument('--num_threads', default='auto', help="CPU training intra-op threads, 'auto' uses every usable CPU on every socket")
+    parser.add_argument('--interop_threads', default='auto', help="CPU training inter-op threads, 'auto' is one per socket")
+
+
+def add_data_arguments(parser):
     parser.add_argument('-b', '--batch_size', type=int, default=32, help='Batch size')
     parser.add_argument('-l', '--max_length', type=int, default=128, help='Maximum sequence length')
-    parser.add_argument('-c', '--cnn', type=bool, default=False, help='CNN Model Type')
-    parser.add_argument('-v', '--version', choices=['1', '2'], default=1, help='Model Version')
+    parser.add_argument('--tokenize_mode', choices=['slow', 'batched'], default='slow', help='Per-row slow tokenizer or chunked fast tokenizer')
+    parser.add_argument('--num_workers', default='auto', help="DataLoader workers per loader, 0 for the in-process fast path or 'auto' to decide from measured batch fetch time")
+    parser.add_argument('--pin_memory', action=argparse.BooleanOptionalAction, default=None, help='Pin batch memory, defaults to on only when CUDA is available')
+    parser.add_argument('--persistent_workers', action=argparse.BooleanOptionalAction, default=True, help='Keep DataLoader workers alive between epochs')
+    parser.add_argument('--prefetch_factor', type=int, default=2, help='Batches prefetched per worker')
+    parser.add_argument('--processed_format', choices=['csv', 'parquet'], default='csv', help='File format of the preprocessed dataset')
+    parser.add_argument('--padding_mode', choices=['max_length', 'dynamic'], default='max_length', help='Pad every row to max_length or each length-bucketed batch to its longest row')
+
+
+def add_config_arguments(parser):
+    parser.add_argument('--config', default=None, help='YAML or JSON run config, a mapping of option names to values or a list of them for several runs. Flags given on the command line override it.')
+    parser.add_argument('--check', action='store_true', help='Only validate the arguments and config and print the resolved runs')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Train, test, predict, export and benchmark the fake news classifiers')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train = commands.add_parser('train', help='Finetune a model and test its best checkpoint')
+    # -m and test's -c are required, but only checked once the config is merged in since they may come from there
+    train.add_argument('-m', '--model', choices=MODEL_NAMES, default=None, help='Pretrinaed model choices to train')
+    train.add_argument('-lr', '--learning_rate', type=float, default=2e-5, help='Learning rate')
+    train.add_argument('-c', '--cnn', action=argparse.BooleanOptionalAction, default=False, help='CNN Model Type')
+    train.add_argument('-v', '--version', type=int, choices=[1, 2], default=1, help='Model Version')
+    add_data_arguments(train)
+    train.add_argument('--streaming', action='store_true', help='Stream fixed-size tokenized shards instead of keeping every split in memory')
+    train.add_argument('--shard_size', type=int, default=4096, help='Rows per streaming shard')
+    train.add_argument('--shuffle_buffer_size', type=int, default=10000, help='Rows held in the streaming shuffle buffer')
+    add_runtime_arguments(train)
+    train.add_argument('--devices', type=int, default=1, help='Training processes per host, more than 1 runs DDP (gloo on CPU)')
+    train.add_argument('--num_nodes', type=int, default=1, help='Hosts taking part, each one runs main.py with MASTER_ADDR, MASTER_PORT and its NODE_RANK set')
+    train.add_argument('--compile', action='store_true', help='Compile the model forward with torch.compile and use SDPA attention, falls back to eager when unavailable')
+    train.add_argument('--hidden_states', choices=['all', 'top_k'], default='all', help='CNN heads: keep every backbone layer output or capture only the top bert_layers')
+    train.add_argument('--max_epochs', type=int, default=50, help='Epoch budget, early stopping usually ends the run sooner')
+    train.add_argument('--accumulate_grad_batches', type=int, default=1, help='Batches whose gradients are summed before each optimizer step')
+    train.add_argument('--gradient_checkpointing', action='store_true', help='Recompute encoder activations in backward instead of keeping them, for long max_length on little RAM')
+    train.add_argument('--freeze_layers', type=int, default=0, help='Freeze the embeddings and the bottom N encoder layers')
+    train.add_argument('--freeze_embeddings', action='store_true', help='Freeze the embeddings even when no encoder layer is frozen')
+    train.add_argument('--optimizer', choices=['adam', 'fused_adamw'], default='adam', help='Adam as before or AdamW with the fused single-kernel update')
+    train.add_argument('--weight_decay', type=float, default=0.0, help='AdamW weight decay, biases and LayerNorm weights are never decayed')
+    train.add_argument('--scheduler', choices=['constant', 'linear'], default='constant', help='Constant learning rate or linear warmup then linear decay to zero')
+    train.add_argument('--warmup_ratio', type=float, default=0.0, help='Fraction of the optimizer steps spent warming up with --scheduler linear')
+    add_config_arguments(train)
+
+    test = commands.add_parser('test', help='Score a trained checkpoint on the test split')
+    test.add_argument('-c', '--checkpoint', default=None, help='Checkpoint file or run directory under ./checkpoints')
+    test.add_argument('-m', '--model', default=None, help='Model name or local model path, read from the run directory when omitted')
+    test.add_argument('--cnn', action=argparse.BooleanOptionalAction, default=False, help='Checkpoint has a CNN head, only used together with --model')
+    test.add_argument('-v', '--version', type=int, choices=[1, 2], default=1, help='Model Version, only used together with --model')
+    test.add_argument('--hidden_states', choices=['all', 'top_k'], default='top_k', help='CNN heads: keep every backbone layer output or capture only the top bert_layers')
+    add_data_arguments(test)
+    add_runtime_arguments(test)
+    add_config_arguments(test)
+
+    commands.add_parser('predict', add_help=False, help='Batched CSV inference, takes the inference.py arguments')
+    commands.add_parser('export', add_help=False, help='INT8 and ONNX export report, takes the export.py arguments')
+
+    bench = commands.add_parser('bench', help='Run one of the benchmarks, takes that benchmark\'s arguments')
+    bench.add_argument('benchmark', choices=BENCHMARKS, help='Benchmark under benchmarks/')
+    bench.add_argument('arguments', nargs=argparse.REMAINDER, help='Passed on to the benchmark')
+
+    return parser, {'train': train, 'test': test}
+
+
+def load_config(path):
+    with open(path) as file:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            runs = yaml.safe_load(file)
+        else:
+            runs = json.load(file)
+
+    runs = runs if isinstance(runs, list) else [runs]
+    if len(runs) == 0 or not all(isinstance(run, dict) for run in runs):
+        raise ValueError(f'{path} must hold a mapping of option names to values or a non-empty list of them')
+    return runs
+
+
+def config_arguments(parser, run, path):
+    # Turned back into command line tokens, so argparse checks the types and choices of config values as well
+    actions = {action.dest: action for action in parser._actions if action.option_strings}
+    arguments = []
+    for name, value in run.items():
+        action = actions.get(name)
+        if action is None or name in ('config', 'check', 'help'):
+            parser.error(f'{path}: unknown option {name}')
+
+        # null keeps the default, for --pin_memory that is auto rather than false
+        if value is None:
+            continue
+
+        option = next(option for option in action.option_strings if option.startswith('--') and not option.startswith('--no-'))
+        if isinstance(action, argparse.BooleanOptionalAction):
+            arguments.append(option if value else f'--no-{option[2:]}')
+        elif action.nargs == 0:
+            if value:
+                arguments.append(option)
+        else:
+            arguments += [option] + [str(item) for item in (value if isinstance(value, list) else [value])]
+    return arguments
+
+
+def resolve_runs(subparser, args, argv):
+    resolved = [args]
+    if args.config is not None:
+        try:
+            runs = load_config(args.config)
+        except (OSError, ValueError) as error:
+            subparser.error(str(error))
+
+        # Config values come first, so the same flag given on the command line wins
+        resolved = [subparser.parse_args(config_arguments(subparser, run, args.config) + argv[1:]) for run in runs]
+        for run in resolved:
+            run.command = args.command
+
+    required = {'train': ('model', '-m/--model'), 'test': ('checkpoint', '-c/--checkpoint')}[args.command]
+    if any(getattr(run, required[0]) is None for run in resolved):
+        subparser.error(f'the following arguments are required: {required[1]}')
+
+    if len(resolved) > 1 and any(getattr(run, 'devices', 1) > 1 or getattr(run, 'num_nodes', 1) > 1 for run in resolved):
+        # Every DDP rank re-runs this script, so one process cannot move on to the next run by itself
+        subparser.error('A config with several runs cannot use DDP, launch one main.py per run instead')
+
+    return resolved
+
 
-    args = parser.parse_args()
-    config = vars(args)
+def forward_script(module, argv):
+    # Runs the script as if it had been started directly, with its own parser
+    sys.argv = [module] + argv
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+
+
+def train(config):
+    from transformers import AutoTokenizer
+    from pytorch_lightning import Trainer, seed_everything
+    from pytorch_lightning.callbacks import ModelCheckpoint, TQDMProgressBar, EarlyStopping
+    from pytorch_lightning.loggers import TensorBoardLogger, CSVLogger
+    from pytorch_lightning.utilities.rank_zero import rank_zero_only
+    from utils.preprocessor import TwitterDataModule
+    from utils.runtime import DatasetEpoch, EpochTimer, configure_threads, distributed_options, resolve_accelerator, resolve_precision
+    from models.factory import build_model, uses_one_hot_label, pretrained_model_name
+
+    seed_everything(seed=42, workers=True)
 
     # Get arguments values
     model_name = config['model']
@@ -34,53 +185,87 @@ if __name__ == '__main__':
     batch_size = config['batch_size']
     max_length = config['max_length']
     cnn = config['cnn']
-    version = int(config['version'])
+    version = config['version']
+    tokenize_mode = config['tokenize_mode']
+    padding_mode = config['padding_mode']
+    hidden_states = config['hidden_states']
+    compile_model = config['compile']
+    accelerator = resolve_accelerator(config['accelerator'])
+    precision = resolve_precision(config['precision'], accelerator)
+    devices = config['devices']
+    num_nodes = config['num_nodes']
+    num_workers = config['num_workers']
+    pin_memory = config['pin_memory']
+    persistent_workers = config['persistent_workers']
+    prefetch_factor = config['prefetch_factor']
+    processed_format = config['processed_format']
+    streaming = config['streaming']
+    shard_size = config['shard_size']
+    shuffle_buffer_size = config['shuffle_buffer_size']
+    max_epochs = config['max_epochs']
+    accumulate_grad_batches = config['accumulate_grad_batches']
+    gradient_checkpointing = config['gradient_checkpointing']
+    freeze_layers = config['freeze_layers']
+    freeze_embeddings = config['freeze_embeddings']
+    optimizer = config['optimizer']
+    weight_decay = config['weight_decay']
+    scheduler = config['scheduler']
+    warmup_ratio = config['warmup_ratio']
 
-    print(dedent(f'''
+    # Inter-op threads can only be set before torch first uses them, so before the model and data module are built
+    if accelerator == 'cpu':
+        configure_threads(config['num_threads'], config['interop_threads'], processes=devices)
+
+    # Under DDP every rank runs this script, only the first one prints
+    rank_zero_only(print)(dedent(f'''
     -----------------------------------
      Finetune Information        
     -----------------------------------
      Name                | Value       
     -----------------------------------
      Model Name          | {model_name}
-     Batch Size          | {batch_size}
+     Batch Size          | {batch_size} x {accumulate_grad_batches} accumulated
      Learning Rate       | {learning_rate}
+     Optimizer           | {optimizer}, {scheduler} schedule
+     Frozen Layers       | {freeze_layers}{' + embeddings' if freeze_layers > 0 or freeze_embeddings else ''}
+     Grad Checkpointing  | {gradient_checkpointing}
      Input Max Length    | {max_length} 
      Is With CNN         | {cnn} 
      Model Version       | {version} 
+     Padding Mode        | {padding_mode} 
+     DataLoader Workers  | {num_workers} 
+     Streaming           | {streaming} 
+     Compile             | {compile_model} 
+     Accelerator         | {accelerator} 
+     Precision           | {precision} 
+     Processes           | {devices} x {num_nodes} 
     -----------------------------------
     '''))
 
-    pretrained_model_name = {
-        'IndoBERT': 'indolem/indobert-base-uncased',
-        'IndoBERTweet': 'indolem/indobertweet-base-uncased',
-        'IndoRoBERTa_OSCAR': 'flax-community/indonesian-roberta-base',
-        'IndoRoBERTa_Wiki': 'cahya/roberta-base-indonesian-522M',
-    }
-
     pretrained_tokenizer = AutoTokenizer.from_pretrained(pretrained_model_name[model_name], use_fast=False)
 
-    with_cnn_str = ''
-
-    if cnn:
-        with_cnn_str = '_CNN'
-        if version == 1:
-            pretrained_model = AutoModel.from_pretrained(pretrained_model_name[model_name], output_attentions=False, output_hidden_states=True)
-            model = FinetuneWithCNNv1(model=pretrained_model, learning_rate=learning_rate)
-            data_module = TwitterDataModule(tokenizer=pretrained_tokenizer, max_length=max_length, batch_size=batch_size, recreate=True)
-        elif version == 2:
-            pretrained_model = AutoModel.from_pretrained(pretrained_model_name[model_name], output_attentions=False, output_hidden_states=True)
-            model = FinetuneWithCNNv2(model=pretrained_model, learning_rate=learning_rate)
-            data_module = TwitterDataModule(tokenizer=pretrained_tokenizer, max_length=max_length, batch_size=batch_size, recreate=True)
-    else:
-        if version == 1:
-            pretrained_model = AutoModelForSequenceClassification.from_pretrained(pretrained_model_name[model_name], output_attentions=False, output_hidden_states=False, num_labels=2)
-            model = FinetuneV1(model=pretrained_model, learning_rate=learning_rate)
-            data_module = TwitterDataModule(tokenizer=pretrained_tokenizer, max_length=max_length, batch_size=batch_size, recreate=True, one_hot_label=True)
-        elif version == 2:
-            pretrained_model = AutoModel.from_pretrained(pretrained_model_name[model_name], output_attentions=False, output_hidden_states=False)
-            model = FinetuneV2(model=pretrained_model, learning_rate=learning_rate)
-            data_module = TwitterDataModule(tokenizer=pretrained_tokenizer, max_length=max_length, batch_size=batch_size, recreate=True)
+    with_cnn_str = '_CNN' if cnn else ''
+
+    model = build_model(pretrained_model_name[model_name], cnn=cnn, version=version, learning_rate=learning_rate, hidden_states=hidden_states, compile_model=compile_model,
+                        optimizer=optimizer, weight_decay=weight_decay, scheduler=scheduler, warmup_ratio=warmup_ratio,
+                        freeze_layers=freeze_layers, freeze_embeddings=freeze_embeddings, gradient_checkpointing=gradient_checkpointing)
+    data_module = TwitterDataModule(
+        tokenizer=pretrained_tokenizer,
+        max_length=max_length,
+        batch_size=batch_size,
+        recreate=True,
+        one_hot_label=uses_one_hot_label(cnn, version),
+        tokenize_mode=tokenize_mode,
+        padding_mode=padding_mode,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+        persistent_workers=persistent_workers,
+        prefetch_factor=prefetch_factor,
+        streaming=streaming,
+        shard_size=shard_size,
+        shuffle_buffer_size=shuffle_buffer_size,
+        processed_format=processed_format,
+    )
 
     # Initialize callbacks and progressbar
     tensor_board_logger = TensorBoardLogger('tensorboard_logs', name=f'{model_name}{with_cnn_str}_version{version}/{batch_size}_{learning_rate}')
@@ -88,17 +273,96 @@ if __name__ == '__main__':
     checkpoint_callback = ModelCheckpoint(dirpath=f'./checkpoints/{model_name}{with_cnn_str}_version{version}/{batch_size}_{learning_rate}', monitor='val_f1_score', mode='max')
     early_stop_callback = EarlyStopping(monitor='val_f1_score', min_delta=0.00, check_on_train_epoch_end=1, patience=3, mode='max')
     tqdm_progress_bar = TQDMProgressBar()
+    epoch_timer = EpochTimer()
 
     # Initialize Trainer
     trainer = Trainer(
-        accelerator='gpu',
-        max_epochs=50,
+        accelerator=accelerator,
+        precision=precision,
+        max_epochs=max_epochs,
+        accumulate_grad_batches=accumulate_grad_batches,
         default_root_dir=f'./checkpoints/{model_name}{with_cnn_str}_version{version}/{batch_size}_{learning_rate}',
-        callbacks=[checkpoint_callback, early_stop_callback, tqdm_progress_bar],
+        callbacks=[checkpoint_callback, early_stop_callback, tqdm_progress_bar, epoch_timer, DatasetEpoch()],
         logger=[tensor_board_logger, csv_logger],
         log_every_n_steps=5,
-        deterministic=True  # To ensure reproducible results
+        deterministic=True,  # To ensure reproducible results
+        # The CNN heads never read the pooler, DDP has to be told some parameters get no gradient
+        **distributed_options(accelerator, devices=devices, num_nodes=num_nodes, find_unused_parameters=cnn)
     )
 
     trainer.fit(model, datamodule=data_module)
-    trainer.test(datamodule=data_module, ckpt_path='best')
\ No newline at end of file
+    trainer.test(datamodule=data_module, ckpt_path='best')
+
+
+def test(config):
+    from transformers import AutoTokenizer
+    from pytorch_lightning import Trainer, seed_everything
+    from utils.preprocessor import TwitterDataModule
+    from utils.runtime import configure_threads, resolve_accelerator, resolve_precision
+    from models.factory import build_model, uses_one_hot_label, pretrained_model_name
+    from inference import find_checkpoint, load_checkpoint, parse_run_name
+
+    seed_everything(seed=42, workers=True)
+
+    accelerator = resolve_accelerator(config['accelerator'])
+    if accelerator == 'cpu':
+        configure_threads(config['num_threads'], config['interop_threads'])
+
+    checkpoint_path = find_checkpoint(config['checkpoint'])
+    if config['model'] is None:
+        model_name, cnn, version = parse_run_name(checkpoint_path)
+    else:
+        model_name, cnn, version = config['model'], config['cnn'], config['version']
+
+    # Only the architecture is built, the weights all come from the checkpoint
+    pretrained_name = pretrained_model_name.get(model_name, model_name)
+    model = build_model(pretrained_name, cnn=cnn, version=version, pretrained=False, hidden_states=config['hidden_states'])
+    model.load_state_dict(load_checkpoint(checkpoint_path)['state_dict'])
+    print(f'[ Loaded {checkpoint_path} ]')
+
+    data_module = TwitterDataModule(
+        tokenizer=AutoTokenizer.from_pretrained(pretrained_name, use_fast=False),
+        max_length=config['max_length'],
+        batch_size=config['batch_size'],
+        one_hot_label=uses_one_hot_label(cnn, version),
+        tokenize_mode=config['tokenize_mode'],
+        padding_mode=config['padding_mode'],
+        num_workers=config['num_workers'],
+        pin_memory=config['pin_memory'],
+        persistent_workers=config['persistent_workers'],
+        prefetch_factor=config['prefetch_factor'],
+        processed_format=config['processed_format'],
+    )
+
+    trainer = Trainer(accelerator=accelerator, precision=resolve_precision(config['precision'], accelerator), logger=False)
+    trainer.test(model, datamodule=data_module)
+
+
+if __name__ == '__main__':
+
+    argv = sys.argv[1:]
+
+    # predict and export keep their own parsers, everything after the command goes to them untouched
+    if len(argv) > 0 and argv[0] in FORWARDED_SCRIPTS:
+        forward_script(FORWARDED_SCRIPTS[argv[0]], argv[1:])
+        sys.exit(0)
+
+    parser, subparsers = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        forward_script(f'benchmarks.{args.benchmark}', args.arguments)
+        sys.exit(0)
+
+    runs = resolve_runs(subparsers[args.command], args, argv)
+
+    if args.check:
+        for index, run in enumerate(runs):
+            print(f'[ Run {index + 1}/{len(runs)} ] {json.dumps({key: value for key, value in vars(run).items() if key not in ("config", "check")})}')
+        sys.exit(0)
+
+    for run in runs:
+        if args.command == 'train':
+            train(vars(run))
+        else:
+            test(vars(run))
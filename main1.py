@@ -8,7 +8,9 @@ from pytorch_lightning import Trainer, seed_everything
 from pytorch_lightning.callbacks import ModelCheckpoint, TQDMProgressBar, EarlyStopping
 from pytorch_lightning.loggers import TensorBoardLogger, CSVLogger
 from utils.preprocessor import TwitterDataModule
-from models.finetune import Finetune, FinetuneWithCNNv1
+from models.finetune import FinetuneV1 as Finetune
+from models.finetune_with_cnn import FinetuneWithCNNv1
+from utils.runtime import resolve_accelerator
 from textwrap import dedent
 
 if __name__ == '__main__':
@@ -55,7 +57,7 @@ if __name__ == '__main__':
 
     # Initialize Trainer
     trainer = Trainer(
-        accelerator='gpu',
+        accelerator=resolve_accelerator('auto'),
         max_epochs=50,
         default_root_dir=f'./checkpoints/{model_name}/{batch_size}_{learning_rate}',
         callbacks=[checkpoint_callback, early_stop_callback, tqdm_progress_bar],
@@ -0,0 +1,217 @@
+import warnings
+import torch
+import pytorch_lightning as pl
+
+from torch.nn import functional as F
+from transformers import get_linear_schedule_with_warmup
+from models.metrics import BinaryConfusionMatrix
+
+
+def compile_error_types():
+    # Raised while dynamo traces or inductor builds the graph. TorchRuntimeError is the model's own error seen during tracing,
+    # eager would raise it too. Resolved once by compile_forward, importing dynamo costs about a second nobody else should pay.
+    from torch._dynamo.exc import TorchDynamoException, TorchRuntimeError
+
+    try:
+        from torch._inductor.exc import CppCompileError, InvalidCxxCompiler
+    except ImportError:
+        return (TorchDynamoException,), TorchRuntimeError
+    return (TorchDynamoException, CppCompileError, InvalidCxxCompiler), TorchRuntimeError
+
+
+class FinetuneBase(pl.LightningModule):
+
+    # Training, evaluation and prediction for every backbone + head pair, the heads only map a batch to logits
+    def __init__(self, model, head, learning_rate=2e-5) -> None:
+        super(FinetuneBase, self).__init__()
+        self.model = model
+        self.head = head
+        self.lr = learning_rate
+
+        self.val_metrics = BinaryConfusionMatrix()
+        self.test_metrics = BinaryConfusionMatrix()
+
+        self.compiled_logits = None
+
+        self.optimizer_name = 'adam'
+        self.weight_decay = 0.0
+        self.scheduler_name = 'constant'
+        self.warmup_ratio = 0.0
+
+    def logits(self, input_ids, attention_mask):
+        return self.head(self.model, input_ids, attention_mask)
+
+    def forward(self, input_ids, attention_mask):
+        if self.compiled_logits is not None:
+            try:
+                return self.compiled_logits(self, input_ids, attention_mask)
+            except Exception as error:
+                # torch.compile only builds on the first call, a missing compiler or unsupported op shows up here.
+                # Anything else is a real bug and is raised, the fallback warns once and stays eager from then on
+                compile_errors, model_errors = self.compile_errors
+                if not isinstance(error, compile_errors) or isinstance(error, model_errors):
+                    raise
+                warnings.warn(f'Compiled forward failed, falling back to eager: {error}')
+                self.compiled_logits = None
+        return self.logits(input_ids, attention_mask)
+
+    def compile_forward(self, **options):
+        if not hasattr(torch, 'compile'):
+            warnings.warn(f'torch {torch.__version__} has no torch.compile, running eager')
+            return self
+
+        self.compile_errors = compile_error_types()
+
+        # Compiled from the unbound function so a deepcopy (quantize_dynamic, sweeps) runs its own weights and not the original's
+        self.compiled_logits = torch.compile(type(self).logits, **options)
+        return self
+
+    def load_state_dict(self, state_dict, strict=True, *args, **kwargs):
+        # Checkpoints from before the heads were split out keep the head weights at the top level
+        state_dict = {key if key.startswith(('model.', 'head.')) else f'head.{key}': value for key, value in state_dict.items()}
+        return super(FinetuneBase, self).load_state_dict(state_dict, strict, *args, **kwargs)
+
+    def configure_training(self, optimizer='adam', weight_decay=0.0, scheduler='constant', warmup_ratio=0.0):
+        # Read by configure_optimizers once the Trainer knows how many optimizer steps the run takes
+        self.optimizer_name = optimizer
+        self.weight_decay = weight_decay
+        self.scheduler_name = scheduler
+        self.warmup_ratio = warmup_ratio
+        return self
+
+    def freeze_backbone(self, num_layers=0, embeddings=True):
+        # Frozen weights get no gradient and no optimizer state, and the layers below them keep no activations for backward.
+        # Frozen encoder layers always take the embeddings with them, training those would backpropagate through the frozen layers anyway.
+        base_model = self.model.base_model
+        modules = ([base_model.embeddings] if embeddings or num_layers > 0 else []) + list(base_model.encoder.layer[:num_layers])
+        for module in modules:
+            module.requires_grad_(False)
+        return self
+
+    def enable_gradient_checkpointing(self):
+        # Only each encoder layer's input is kept, the rest is recomputed in backward. Non-reentrant checkpointing
+        # still backpropagates into a layer whose input needs no gradient, e.g. right above frozen embeddings.
+        try:
+            self.model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={'use_reentrant': False})
+            return self
+        except TypeError:
+            # transformers < 4.35 has no gradient_checkpointing_kwargs, only its default reentrant checkpointing
+            pass
+        except ValueError as error:
+            warnings.warn(f'Gradient checkpointing unavailable for {type(self.model).__name__}, keeping every activation: {error}')
+            return self
+
+        try:
+            self.model.gradient_checkpointing_enable()
+        except ValueError as error:
+            warnings.warn(f'Gradient checkpointing unavailable for {type(self.model).__name__}, keeping every activation: {error}')
+            return self
+
+        # Reentrant checkpointing skips a layer whose inputs need no gradient, so the embedding output has to ask for one
+        if hasattr(self.model, 'enable_input_require_grads'):
+            self.model.enable_input_require_grads()
+        return self
+
+    def configure_optimizers(self):
+        # Adam state is only allocated for the parameters that still train
+        parameters = [parameter for parameter in self.parameters() if parameter.requires_grad]
+
+        if self.optimizer_name == 'adam':
+            optimizer = torch.optim.Adam(parameters, lr=self.lr)
+        else:
+            optimizer = self.fused_adamw(parameters)
+
+        if self.scheduler_name == 'constant':
+            return optimizer
+
+        # Counted in optimizer steps, so gradient accumulation and max_epochs are already accounted for
+        total_steps = self.trainer.estimated_stepping_batches
+        scheduler = get_linear_schedule_with_warmup(optimizer, int(total_steps * self.warmup_ratio), total_steps)
+        return {'optimizer': optimizer, 'lr_scheduler': {'scheduler': scheduler, 'interval': 'step'}}
+
+    def fused_adamw(self, parameters):
+        # Biases and LayerNorm weights are not decayed
+        decay = [parameter for parameter in parameters if parameter.dim() > 1]
+        no_decay = [parameter for parameter in parameters if parameter.dim() <= 1]
+        groups = [{'params': decay, 'weight_decay': self.weight_decay}, {'params': no_decay, 'weight_decay': 0.0}]
+
+        try:
+            # One kernel updates every parameter instead of a loop of small ops per tensor
+            return torch.optim.AdamW(groups, lr=self.lr, fused=True)
+        except (RuntimeError, TypeError) as error:
+            warnings.warn(f'Fused AdamW unavailable, using the default implementation: {error}')
+            return torch.optim.AdamW(groups, lr=self.lr)
+
+    def compute_loss(self, logits, targets):
+        # Sigmoid and BCE fused in one kernel, against one-hot targets for the two-logit head like the HF multi-label loss it replaces
+        if self.head.num_logits == 1:
+            logits = logits.squeeze(dim=1)
+        return F.binary_cross_entropy_with_logits(logits, targets)
+
+    def probabilities(self, logits):
+        if self.head.num_logits == 1:
+            return torch.sigmoid(logits.squeeze(dim=1))
+        return torch.softmax(logits, dim=1)[:, 1]
+
+    def predictions(self, logits):
+        # sigmoid(x) >= 0.5 is x >= 0, no need to go through the sigmoid
+        if self.head.num_logits == 1:
+            return (logits.squeeze(dim=1) >= 0).int()
+        return torch.argmax(logits, dim=1)
+
+    def labels(self, targets):
+        return torch.argmax(targets, dim=1) if self.head.num_logits == 2 else targets
+
+    def training_step(self, batch, batch_idx):
+        input_ids, attention_mask, targets = batch
+        loss = self.compute_loss(self(input_ids=input_ids, attention_mask=attention_mask), targets)
+
+        # Logged as a tensor, Lightning averages it on the device and only reads it back when it reports
+        self.log('train_loss', loss.detach(), prog_bar=False, on_epoch=True)
+
+        return loss
+
+    def validation_step(self, batch, batch_idx):
+        loss, true, pred = self._shared_eval_step(batch, batch_idx)
+        self.val_metrics.update(loss, true, pred)
+        return loss
+
+    def on_validation_epoch_start(self):
+        self.val_metrics.reset()
+
+    def on_validation_epoch_end(self):
+        metrics = self.val_metrics.compute('val')
+
+        # Already reduced over every rank, so one process printing is enough
+        if self.global_rank == 0:
+            print()
+            print(metrics)
+
+        # Every rank already holds the same values, sync_dist only averages identical numbers and keeps Lightning from warning
+        self.log_dict(metrics, prog_bar=False, on_epoch=True, sync_dist=True)
+
+    def test_step(self, batch, batch_idx):
+        loss, true, pred = self._shared_eval_step(batch, batch_idx)
+        self.test_metrics.update(loss, true, pred)
+        return loss
+
+    def on_test_epoch_start(self):
+        self.test_metrics.reset()
+
+    def on_test_epoch_end(self):
+        metrics = self.test_metrics.compute('test')
+
+        self.log_dict(metrics, prog_bar=False, on_epoch=True, sync_dist=True)
+
+    def _shared_eval_step(self, batch, batch_idx):
+        input_ids, attention_mask, targets = batch
+        logits = self(input_ids=input_ids, attention_mask=attention_mask)
+
+        return self.compute_loss(logits, targets), self.labels(targets), self.predictions(logits)
+
+    def predict_proba(self, input_ids, attention_mask):
+        return self.probabilities(self(input_ids=input_ids, attention_mask=attention_mask))
+
+    def predict_step(self, batch, batch_idx):
+        input_ids, attention_mask = batch[0], batch[1]
+        return self.predictions(self(input_ids=input_ids, attention_mask=attention_mask)).cpu()
@@ -0,0 +1,75 @@
+import warnings
+
+from transformers import AutoConfig, AutoModel, AutoModelForSequenceClassification
+from models.finetune import FinetuneV1, FinetuneV2
+from models.finetune_with_cnn import FinetuneWithCNNv1, FinetuneWithCNNv2
+
+pretrained_model_name = {
+    'IndoBERT': 'indolem/indobert-base-uncased',
+    'IndoBERTweet': 'indolem/indobertweet-base-uncased',
+    'IndoRoBERTa_OSCAR': 'flax-community/indonesian-roberta-base',
+    'IndoRoBERTa_Wiki': 'cahya/roberta-base-indonesian-522M',
+}
+
+
+def get_model_class(cnn, version):
+    if cnn:
+        return FinetuneWithCNNv1 if version == 1 else FinetuneWithCNNv2
+    return FinetuneV1 if version == 1 else FinetuneV2
+
+
+def uses_one_hot_label(cnn, version):
+    # Only FinetuneV1 trains against the two-logit HF classification head
+    return not cnn and version == 1
+
+
+def load_backbone(pretrained_name, cnn, version, pretrained=True, attn_implementation=None):
+    # pretrained=False only builds the architecture, for when the weights come from a checkpoint anyway
+    if cnn:
+        auto_class, options = AutoModel, {'output_attentions': False, 'output_hidden_states': True}
+    elif version == 1:
+        auto_class, options = AutoModelForSequenceClassification, {'output_attentions': False, 'output_hidden_states': False, 'num_labels': 2}
+    else:
+        auto_class, options = AutoModel, {'output_attentions': False, 'output_hidden_states': False}
+
+    if attn_implementation is not None:
+        try:
+            return instantiate_backbone(auto_class, pretrained_name, pretrained, dict(options, attn_implementation=attn_implementation))
+        except (ValueError, TypeError, ImportError) as error:
+            # Older transformers or an architecture without that attention kernel, the default attention still works
+            warnings.warn(f'{attn_implementation} attention unavailable for {pretrained_name}, using the default: {error}')
+
+    return instantiate_backbone(auto_class, pretrained_name, pretrained, options)
+
+
+def instantiate_backbone(auto_class, pretrained_name, pretrained, options):
+    if pretrained:
+        return auto_class.from_pretrained(pretrained_name, **options)
+
+    attn_implementation = options.pop('attn_implementation', None)
+    config = AutoConfig.from_pretrained(pretrained_name, **options)
+    if attn_implementation is None:
+        return auto_class.from_config(config)
+    return auto_class.from_config(config, attn_implementation=attn_implementation)
+
+
+def build_model(pretrained_name, cnn=False, version=1, learning_rate=2e-5, pretrained=True, hidden_states='all', compile_model=False,
+                optimizer='adam', weight_decay=0.0, scheduler='constant', warmup_ratio=0.0,
+                freeze_layers=0, freeze_embeddings=False, gradient_checkpointing=False):
+    # compile_model=True switches the backbone to the SDPA attention kernels and compiles the forward, both fall back when unavailable
+    pretrained_model = load_backbone(pretrained_name, cnn, version, pretrained=pretrained, attn_implementation='sdpa' if compile_model else None)
+    if cnn:
+        # hidden_states='top_k' captures only the layers the CNN head reads instead of all of them
+        model = get_model_class(cnn, version)(model=pretrained_model, learning_rate=learning_rate, hidden_states=hidden_states)
+    else:
+        model = get_model_class(cnn, version)(model=pretrained_model, learning_rate=learning_rate)
+
+    model.configure_training(optimizer=optimizer, weight_decay=weight_decay, scheduler=scheduler, warmup_ratio=warmup_ratio)
+    if freeze_layers > 0 or freeze_embeddings:
+        model.freeze_backbone(num_layers=freeze_layers, embeddings=freeze_embeddings)
+    if gradient_checkpointing:
+        model.enable_gradient_checkpointing()
+
+    if compile_model:
+        model.compile_forward()
+    return model
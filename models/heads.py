@@ -0,0 +1,135 @@
+import torch
+
+from torch import nn
+from torch.nn import functional as F
+
+
+# A head owns the backbone call, so it decides which backbone outputs are computed and kept.
+# num_logits is 2 for a softmax over both labels and 1 for a single sigmoid logit.
+
+HIDDEN_STATES_MODES = ['all', 'top_k']
+
+
+def top_hidden_states(backbone, input_ids, attention_mask, num_layers):
+    # Same tensors as hidden_states[-num_layers:], read from forward hooks on the top encoder layers
+    # so the backbone never builds the tuple that keeps every layer alive until the head is done
+    captured = []
+
+    def capture(module, inputs, output):
+        captured.append(output[0] if isinstance(output, tuple) else output)
+
+    handles = [layer.register_forward_hook(capture) for layer in backbone.base_model.encoder.layer[-num_layers:]]
+    try:
+        backbone(input_ids=input_ids, attention_mask=attention_mask, output_hidden_states=False)
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    return captured
+
+
+def backbone_hidden_states(backbone, input_ids, attention_mask, num_layers, mode):
+    if mode == 'top_k':
+        return top_hidden_states(backbone, input_ids, attention_mask, num_layers)
+    return backbone(input_ids=input_ids, attention_mask=attention_mask).hidden_states[-num_layers:]
+
+
+class SequenceClassificationHead(nn.Module):
+
+    num_logits = 2
+
+    # The classifier already lives inside AutoModelForSequenceClassification, so this head has no weights of its own
+    def forward(self, backbone, input_ids, attention_mask):
+        return backbone(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+class PooledMLPHead(nn.Module):
+
+    num_logits = 1
+
+    def __init__(self, hidden_size=768, inner_size=32) -> None:
+        super(PooledMLPHead, self).__init__()
+        self.linear1 = nn.Linear(hidden_size, inner_size)
+        self.linear2 = nn.Linear(inner_size, 1)
+        self.relu = nn.ReLU()
+
+    def forward(self, backbone, input_ids, attention_mask):
+        model_output = backbone(input_ids=input_ids, attention_mask=attention_mask)
+        return self.linear2(self.relu(self.linear1(model_output.pooler_output)))
+
+
+class CNN1DHead(nn.Module):
+
+    num_logits = 1
+
+    def __init__(self, bert_layers=4, out_channels=128, hidden_size=768, kernel_sizes=[3, 4, 5], hidden_states='all') -> None:
+        super(CNN1DHead, self).__init__()
+        self.bert_layers = bert_layers
+        self.hidden_size = hidden_size
+        self.hidden_states = hidden_states
+
+        self.conv1d = nn.ModuleList([
+            nn.Conv1d(in_channels=hidden_size, out_channels=out_channels, kernel_size=kernel_size, padding=(kernel_size - 1)) for kernel_size in kernel_sizes
+        ])
+
+        self.linear = nn.Linear(bert_layers * hidden_size, hidden_size)
+        self.classifier = nn.Linear((out_channels * len(kernel_sizes)), 1)
+
+        self.relu = nn.ReLU()
+        self.dropout = nn.Dropout(0.1)
+
+    def project(self, hidden_states):
+        # A dynamically quantized Linear has packed weights, weight and bias are methods there, so it always gets the concat
+        if self.hidden_states == 'all' or not isinstance(self.linear, nn.Linear):
+            return self.linear(torch.cat(hidden_states, dim=-1))
+
+        # linear(cat(h_1..h_k)) is the sum of h_i through the matching weight columns, without the [B, L, k * hidden] concat
+        projected = F.linear(hidden_states[0], self.linear.weight[:, :self.hidden_size], self.linear.bias)
+        for index, hidden_state in enumerate(hidden_states[1:], start=1):
+            projected = projected + F.linear(hidden_state, self.linear.weight[:, index * self.hidden_size:(index + 1) * self.hidden_size])
+        return projected
+
+    def forward(self, backbone, input_ids, attention_mask):
+        hidden_states = backbone_hidden_states(backbone, input_ids, attention_mask, self.bert_layers, self.hidden_states)
+        prepared_conv_input = self.project(hidden_states).permute(0, 2, 1)
+
+        out_conv = []
+        for conv in self.conv1d:
+            x = conv(prepared_conv_input)
+            out_conv.append(F.max_pool1d(self.relu(x), x.size(2)))
+
+        logits = torch.cat(out_conv, 1).squeeze(dim=-1)
+        return self.classifier(self.dropout(logits))
+
+
+class CNN2DHead(nn.Module):
+
+    num_logits = 1
+
+    def __init__(self, bert_layers=4, out_channels=128, hidden_size=768, kernel_sizes=[3, 4, 5], hidden_states='all') -> None:
+        super(CNN2DHead, self).__init__()
+        self.bert_layers = bert_layers
+        self.hidden_states = hidden_states
+
+        self.conv2d = nn.ModuleList([
+            nn.Conv2d(in_channels=bert_layers, out_channels=out_channels, kernel_size=[kernel_size, hidden_size], padding=(kernel_size - 1, 0)) for kernel_size in kernel_sizes
+        ])
+
+        # Unused by forward, kept so checkpoints trained before the heads were split out still load strictly
+        self.linear = nn.Linear(hidden_size, hidden_size)
+        self.classifier = nn.Linear((out_channels * len(kernel_sizes)), 1)
+
+        self.relu = nn.ReLU()
+        self.dropout = nn.Dropout(0.1)
+
+    def forward(self, backbone, input_ids, attention_mask):
+        hidden_states = backbone_hidden_states(backbone, input_ids, attention_mask, self.bert_layers, self.hidden_states)
+        hs_output = torch.stack(hidden_states, dim=1)
+
+        out_conv = []
+        for conv in self.conv2d:
+            x = self.relu(conv(hs_output)).squeeze(-1)
+            out_conv.append(F.max_pool1d(x, x.size(2)))
+
+        logits = torch.cat(out_conv, 1).squeeze(dim=-1)
+        return self.classifier(self.dropout(logits))
@@ -0,0 +1,56 @@
+import torch
+import torch.distributed as dist
+
+from torch import nn
+from torch.nn import functional as F
+
+
+class BinaryConfusionMatrix(nn.Module):
+
+    # Running tn, fp, fn, tp counts and the summed batch loss, kept on the model device so a step never waits on the host
+    def __init__(self) -> None:
+        super(BinaryConfusionMatrix, self).__init__()
+        # Not persistent, so checkpoints stay loadable with and without these buffers
+        self.register_buffer('counts', torch.zeros(4, dtype=torch.long), persistent=False)
+        self.register_buffer('steps', torch.zeros(1, dtype=torch.long), persistent=False)
+        self.register_buffer('loss_sum', torch.zeros(1, dtype=torch.float64), persistent=False)
+
+    def reset(self):
+        self.counts.zero_()
+        self.steps.zero_()
+        self.loss_sum.zero_()
+
+    @torch.no_grad()
+    def update(self, loss, true, pred):
+        # true * 2 + pred is 0 tn, 1 fp, 2 fn, 3 tp, one_hot avoids the host sync bincount does on cuda
+        index = true.long().view(-1) * 2 + pred.long().view(-1)
+        self.counts += F.one_hot(index, num_classes=4).sum(dim=0)
+        self.steps += 1
+        self.loss_sum += loss.detach().double()
+
+    def sync(self):
+        if dist.is_available() and dist.is_initialized():
+            dist.all_reduce(self.counts)
+            dist.all_reduce(self.steps)
+            dist.all_reduce(self.loss_sum)
+
+    def compute(self, prefix):
+        self.sync()
+
+        # The single host transfer of the epoch
+        tn, fp, fn, tp = self.counts.tolist()
+        steps, loss_sum = self.steps.item(), self.loss_sum.item()
+
+        # Same definitions and zero_division=0 as sklearn classification_report for label 1
+        precision = tp / (tp + fp) if tp + fp > 0 else 0.0
+        recall = tp / (tp + fn) if tp + fn > 0 else 0.0
+        total = tn + fp + fn + tp
+
+        metrics = {}
+        metrics[f'{prefix}_loss'] = loss_sum / steps if steps > 0 else 0.0
+        metrics[f'{prefix}_accuracy'] = (tp + tn) / total if total > 0 else 0.0
+        metrics[f'{prefix}_f1_score'] = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+        metrics[f'{prefix}_precision'] = precision
+        metrics[f'{prefix}_recall'] = recall
+
+        return metrics
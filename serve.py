@@ -0,0 +1,214 @@
+import json
+import time
+import asyncio
+import argparse
+import collections
+import torch
+
+from concurrent.futures import ThreadPoolExecutor
+from inference import InferenceEngine
+
+HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class ServingStats():
+
+    def __init__(self, window=10000) -> None:
+        # Only the most recent latencies are kept so the percentiles follow the current load
+        self.latencies = collections.deque(maxlen=window)
+        self.batch_sizes = collections.Counter()
+        self.total_requests = 0
+        self.total_batches = 0
+
+    def record_batch(self, latencies):
+        self.latencies.extend(latencies)
+        self.batch_sizes[len(latencies)] += 1
+        self.total_requests += len(latencies)
+        self.total_batches += 1
+
+    def percentile(self, q):
+        if len(self.latencies) == 0:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def to_dict(self):
+        return {
+            'requests': self.total_requests,
+            'batches': self.total_batches,
+            'mean_batch_size': self.total_requests / self.total_batches if self.total_batches > 0 else None,
+            'latency_ms': {'p50': self.percentile(0.50), 'p90': self.percentile(0.90), 'p99': self.percentile(0.99)},
+            'batch_size_histogram': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+        }
+
+
+class MicroBatcher():
+
+    def __init__(self, engine, max_batch_size=32, max_wait_ms=10) -> None:
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = ServingStats()
+        self.queue = asyncio.Queue()
+        # One forward pass at a time, torch already spreads each one over the intra-op threads
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def submit(self, headline, text):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(((headline, text), future, time.perf_counter()))
+        return await future
+
+    async def collect_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+
+        # Wait at most max_wait after the first request for more to arrive, or until the batch is full
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self.collect_batch()
+            items = [item for item, _, _ in batch]
+
+            try:
+                results = await loop.run_in_executor(self.executor, self.engine.predict, items)
+            except Exception as error:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            now = time.perf_counter()
+            for (_, future, enqueued), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+            self.stats.record_batch([(now - enqueued) * 1000 for _, _, enqueued in batch])
+
+
+class ScoringServer():
+
+    def __init__(self, batcher, host='127.0.0.1', port=8000) -> None:
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+
+    async def handle_predict(self, body):
+        payload = json.loads(body or b'{}')
+
+        # Either a single {"headline", "text"} or {"items": [...]}, every item is queued on its own so it can share a batch with other requests
+        if 'items' in payload:
+            results = await asyncio.gather(*[self.batcher.submit(str(item.get('headline', '')), str(item.get('text', ''))) for item in payload['items']])
+            return {'results': results}
+
+        return await self.batcher.submit(str(payload.get('headline', '')), str(payload.get('text', '')))
+
+    async def route(self, method, path, body):
+        if path == '/predict':
+            if method != 'POST':
+                return 405, {'error': 'use POST'}
+            try:
+                return 200, await self.handle_predict(body)
+            except (ValueError, AttributeError, TypeError) as error:
+                return 400, {'error': str(error)}
+        elif path == '/metrics':
+            return 200, self.batcher.stats.to_dict()
+        elif path == '/health':
+            return 200, {'status': 'ok'}
+
+        return 404, {'error': f'unknown path {path}'}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            # HTTP/1.1 keep-alive, one request after another on the same connection
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                try:
+                    status, response = await self.route(method, path.split('?', 1)[0], body)
+                except Exception as error:
+                    status, response = 500, {'error': str(error)}
+
+                response_body = json.dumps(response).encode('utf-8')
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f'HTTP/1.1 {status} {HTTP_STATUS[status]}\r\n'
+                    f'Content-Type: application/json\r\n'
+                    f'Content-Length: {len(response_body)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + response_body
+                )
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        batcher_task = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+
+        print(f'[ Serving On http://{self.host}:{self.port} (max batch {self.batcher.max_batch_size}, max wait {self.batcher.max_wait * 1000:.0f} ms) ]')
+
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                batcher_task.cancel()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Local HTTP scoring service with dynamic micro-batching')
+    parser.add_argument('-c', '--checkpoint', required=True, help='Checkpoint file or run directory under ./checkpoints')
+    parser.add_argument('-m', '--model', default=None, help='Model name from main.py, read from the run directory when omitted')
+    parser.add_argument('--cnn', action='store_true', help='Checkpoint has a CNN head, only used together with --model')
+    parser.add_argument('-v', '--version', type=int, choices=[1, 2], default=1, help='Model Version, only used together with --model')
+    parser.add_argument('-l', '--max_length', type=int, default=128, help='Maximum sequence length')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=8000, help='Bind port')
+    parser.add_argument('--max_batch_size', type=int, default=32, help='Largest micro-batch per forward pass')
+    parser.add_argument('--max_wait_ms', type=float, default=10, help='How long the first request of a batch waits for others')
+    parser.add_argument('-t', '--num_threads', type=int, default=None, help='torch intra-op threads')
+    parser.add_argument('-q', '--quantize', action='store_true', help='Dynamic INT8 quantization of the Linear layers')
+    parser.add_argument('--compile', action='store_true', help='torch.compile the forward and use SDPA attention, falls back to eager when unavailable')
+
+    args = parser.parse_args()
+
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+
+    if args.model is None:
+        engine = InferenceEngine.from_checkpoint(args.checkpoint, quantize=args.quantize, compile_model=args.compile, max_length=args.max_length, batch_size=args.max_batch_size)
+    else:
+        engine = InferenceEngine.from_checkpoint(args.checkpoint, model_name=args.model, cnn=args.cnn, version=args.version, quantize=args.quantize, compile_model=args.compile, max_length=args.max_length, batch_size=args.max_batch_size)
+
+    batcher = MicroBatcher(engine, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    asyncio.run(ScoringServer(batcher, host=args.host, port=args.port).serve())
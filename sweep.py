@@ -0,0 +1,222 @@
+import os
+import time
+import random
+import argparse
+import itertools
+import torch
+import torch.multiprocessing as mp
+import pandas as pd
+
+from transformers import AutoTokenizer
+from pytorch_lightning import Trainer, seed_everything
+from pytorch_lightning.callbacks import Callback, EarlyStopping
+from models.factory import build_model, load_backbone, uses_one_hot_label, pretrained_model_name
+from utils.preprocessor import TwitterDataModule
+from utils.runtime import configure_threads, resolve_accelerator
+
+# Usage: python sweep.py -m IndoBERT --search asha --trials 16 --workers 4 --learning_rate 1e-5 2e-5 5e-5 --batch_size 16 32
+
+MONITOR = 'val_f1_score'
+
+# Filled once per worker process by init_worker, so each trial only builds the architecture and copies weights in
+worker_state = {}
+
+
+def backbone_kind(cnn, version):
+    # FinetuneV1 wraps AutoModelForSequenceClassification, every other variant the bare AutoModel with the same weights
+    return 'sequence_classification' if uses_one_hot_label(cnn, version) else 'base'
+
+
+def load_pristine_weights(pretrained_name, space):
+    pristine = {}
+    for cnn, version in set(itertools.product(space['cnn'], space['version'])):
+        kind = backbone_kind(cnn, version)
+        if kind not in pristine:
+            torch.manual_seed(42)
+            state_dict = load_backbone(pretrained_name, cnn, version).state_dict()
+            # Shared memory, so the worker processes map the same pages instead of each receiving a copy
+            pristine[kind] = {key: value.share_memory_() for key, value in state_dict.items()}
+    return pristine
+
+
+def grid_trials(space):
+    keys = list(space.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*[space[key] for key in keys])]
+
+
+def random_trials(space, num_trials, seed=42):
+    # Sampled without replacement, a small space is not trained twice with the same settings
+    grid = grid_trials(space)
+    return random.Random(seed).sample(grid, min(num_trials, len(grid)))
+
+
+def asha_rungs(min_epochs, max_epochs, reduction_factor):
+    rungs, epoch = [], min_epochs
+    while epoch < max_epochs:
+        rungs.append(epoch)
+        epoch *= reduction_factor
+    return rungs
+
+
+class AshaPruning(Callback):
+
+    # Asynchronous successive halving, a trial reaching a rung carries on only while its score is in the
+    # top 1 / reduction_factor of every score recorded at that rung so far, by any worker
+    def __init__(self, rungs, reduction_factor, rung_scores, lock) -> None:
+        self.rungs = rungs
+        self.reduction_factor = reduction_factor
+        self.rung_scores = rung_scores
+        self.lock = lock
+        self.pruned_at = None
+
+    def on_validation_end(self, trainer, pl_module):
+        epoch = trainer.current_epoch + 1
+        if trainer.sanity_checking or epoch not in self.rungs or MONITOR not in trainer.callback_metrics:
+            return
+
+        score = float(trainer.callback_metrics[MONITOR])
+        with self.lock:
+            scores = self.rung_scores.get(epoch, []) + [score]
+            self.rung_scores[epoch] = scores
+
+        keep = max(1, len(scores) // self.reduction_factor)
+        if score < sorted(scores, reverse=True)[keep - 1]:
+            self.pruned_at = epoch
+            trainer.should_stop = True
+
+
+def init_worker(tokenizer, pristine, rung_scores, lock, num_workers):
+    configure_threads('auto', 'auto', processes=num_workers)
+    worker_state.update(tokenizer=tokenizer, pristine=pristine, rung_scores=rung_scores, lock=lock)
+
+
+def run_trial(trial):
+    index, params, options = trial['index'], trial['params'], trial['options']
+    start = time.perf_counter()
+    seed_everything(options['seed'], workers=True)
+
+    model = build_model(options['pretrained_name'], cnn=params['cnn'], version=params['version'], learning_rate=params['learning_rate'], pretrained=False)
+    model.model.load_state_dict(worker_state['pristine'][backbone_kind(params['cnn'], params['version'])])
+
+    # The tensor cache was filled by the parent, every trial with the same max_length maps the same files
+    data_module = TwitterDataModule(
+        tokenizer=worker_state['tokenizer'],
+        max_length=params['max_length'],
+        batch_size=params['batch_size'],
+        one_hot_label=uses_one_hot_label(params['cnn'], params['version']),
+        num_workers=0,
+    )
+
+    callbacks = [EarlyStopping(monitor=MONITOR, min_delta=0.00, patience=options['patience'], mode='max')]
+    pruning = None
+    if options['rungs']:
+        pruning = AshaPruning(options['rungs'], options['reduction_factor'], worker_state['rung_scores'], worker_state['lock'])
+        callbacks.append(pruning)
+
+    best = {}
+
+    class BestScore(Callback):
+
+        def on_validation_end(self, trainer, pl_module):
+            metrics = {key: float(value) for key, value in trainer.callback_metrics.items() if key.startswith('val_')}
+            if not trainer.sanity_checking and MONITOR in metrics and metrics[MONITOR] >= best.get(MONITOR, -1):
+                best.update(metrics, epoch=trainer.current_epoch + 1)
+
+    trainer = Trainer(
+        accelerator=options['accelerator'],
+        max_epochs=options['max_epochs'],
+        limit_train_batches=options['limit_train_batches'],
+        callbacks=callbacks + [BestScore()],
+        logger=False,
+        enable_checkpointing=False,
+        enable_progress_bar=False,
+        enable_model_summary=False,
+        num_sanity_val_steps=0,
+    )
+    trainer.fit(model, datamodule=data_module)
+
+    return dict(
+        trial=index,
+        **params,
+        status='pruned' if pruning is not None and pruning.pruned_at is not None else 'completed',
+        epochs=trainer.current_epoch if trainer.should_stop else options['max_epochs'],
+        best_epoch=best.get('epoch'),
+        val_f1_score=best.get('val_f1_score'),
+        val_accuracy=best.get('val_accuracy'),
+        val_loss=best.get('val_loss'),
+        seconds=time.perf_counter() - start,
+    )
+
+
+def parse_bool(value):
+    return str(value).lower() in ('1', 'true', 'yes', 'y')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Hyperparameter sweep sharing the tensor cache and pretrained weights across parallel trials')
+    parser.add_argument('-m', '--model', default='IndoBERT', help='Model name from main.py or a local model path')
+    parser.add_argument('--search', choices=['grid', 'random', 'asha'], default='grid', help='Full grid, random samples, or random samples with ASHA pruning')
+    parser.add_argument('--trials', type=int, default=16, help='Sampled trials for random and asha')
+    parser.add_argument('--workers', type=int, default=2, help='Trials trained in parallel, each in its own process')
+    parser.add_argument('--learning_rate', type=float, nargs='+', default=[2e-5], help='Learning rates to try')
+    parser.add_argument('--batch_size', type=int, nargs='+', default=[32], help='Batch sizes to try')
+    parser.add_argument('--max_length', type=int, nargs='+', default=[128], help='Maximum sequence lengths to try')
+    parser.add_argument('--cnn', type=parse_bool, nargs='+', default=[False], help='CNN head on/off, e.g. --cnn false true')
+    parser.add_argument('--version', type=int, nargs='+', choices=[1, 2], default=[1], help='Model versions to try')
+    parser.add_argument('--max_epochs', type=int, default=9, help='Epoch budget per trial')
+    parser.add_argument('--patience', type=int, default=3, help='Early stopping patience on val_f1_score, like main.py')
+    parser.add_argument('--min_epochs', type=int, default=1, help='First ASHA rung')
+    parser.add_argument('--reduction_factor', type=int, default=3, help='ASHA keeps the top 1/reduction_factor at every rung')
+    parser.add_argument('--limit_train_batches', type=float, default=1.0, help='Fraction (or count, if > 1) of training batches per epoch')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for sampling and for every trial')
+    parser.add_argument('-o', '--output', default='sweeps/summary.csv', help='Summary CSV')
+
+    args = parser.parse_args()
+
+    pretrained_name = pretrained_model_name.get(args.model, args.model)
+    space = {'learning_rate': args.learning_rate, 'batch_size': args.batch_size, 'max_length': args.max_length, 'cnn': args.cnn, 'version': args.version}
+
+    if args.search == 'grid':
+        trials = grid_trials(space)
+    else:
+        trials = random_trials(space, args.trials, seed=args.seed)
+
+    # Load the tokenizer once, fill the tensor cache for every max_length / label encoding, keep one pristine copy of the weights
+    tokenizer = AutoTokenizer.from_pretrained(pretrained_name, use_fast=False)
+    for max_length, one_hot_label in sorted({(params['max_length'], uses_one_hot_label(params['cnn'], params['version'])) for params in trials}):
+        TwitterDataModule(tokenizer=tokenizer, max_length=max_length, one_hot_label=one_hot_label).load_data()
+    pristine = load_pristine_weights(pretrained_name, space)
+
+    options = dict(
+        pretrained_name=pretrained_name,
+        accelerator=resolve_accelerator('auto'),
+        max_epochs=args.max_epochs,
+        patience=args.patience,
+        limit_train_batches=int(args.limit_train_batches) if args.limit_train_batches > 1 else args.limit_train_batches,
+        rungs=asha_rungs(args.min_epochs, args.max_epochs, args.reduction_factor) if args.search == 'asha' else [],
+        reduction_factor=args.reduction_factor,
+        seed=args.seed,
+    )
+
+    print(f'[ {len(trials)} Trials On {args.workers} Workers ({args.search}{", rungs " + str(options["rungs"]) if options["rungs"] else ""}) ]')
+
+    context = mp.get_context('spawn')
+    manager = context.Manager()
+    rung_scores, lock = manager.dict(), manager.Lock()
+
+    results = []
+    start = time.perf_counter()
+    with context.Pool(args.workers, initializer=init_worker, initargs=(tokenizer, pristine, rung_scores, lock, args.workers)) as pool:
+        jobs = [{'index': index, 'params': params, 'options': options} for index, params in enumerate(trials)]
+        for result in pool.imap_unordered(run_trial, jobs):
+            results.append(result)
+            print(f'[ Trial {result["trial"]} {result["status"]} After {result["epochs"]} Epochs, {MONITOR} {result["val_f1_score"]} ]')
+
+    summary = pd.DataFrame(results).sort_values('val_f1_score', ascending=False, na_position='last')
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    summary.to_csv(args.output, index=False)
+
+    print()
+    print(summary.to_string(index=False, float_format=lambda value: f'{value:.4g}'))
+    print(f'\n[ {len(results)} Trials In {time.perf_counter() - start:.1f}s, Summary In {args.output} ]')
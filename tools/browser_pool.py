@@ -0,0 +1,126 @@
+import queue
+import threading
+
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+
+def headless_chrome():
+    chromeOptions = webdriver.ChromeOptions()
+    chromeOptions.add_argument('--headless=new')
+    return webdriver.Chrome(options=chromeOptions)
+
+
+class BrowserPool():
+
+    # N reusable browsers leased one caller at a time. A browser is checked before every lease, replaced after it
+    # fails, and restarted after recycle_after pages so a long crawl does not keep growing Chrome's memory.
+    def __init__(self,
+                 size = 1,
+                 recycle_after = 50,
+                 page_timeout = 30,
+                 lease_timeout = None,
+                 factory = headless_chrome):
+        self.size = size
+        self.recycle_after = recycle_after
+        self.page_timeout = page_timeout
+        self.lease_timeout = lease_timeout
+        self.factory = factory
+
+        # None is a free slot whose browser has not been started yet, they are only started when first leased
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(None)
+
+        self.lock = threading.Lock()
+        self.drivers = set()
+        self.uses = {}
+        self.closed = False
+
+        self.started = 0
+        self.recycled = 0
+        self.replaced = 0
+
+    def start_driver(self):
+        driver = self.factory()
+        # A slow SERP raises TimeoutException after page_timeout instead of holding this browser forever
+        driver.set_page_load_timeout(self.page_timeout)
+
+        with self.lock:
+            self.drivers.add(driver)
+            self.uses[driver] = 0
+            self.started += 1
+        return driver
+
+    def quit_driver(self, driver):
+        with self.lock:
+            self.drivers.discard(driver)
+            self.uses.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def healthy(self, driver):
+        try:
+            driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    @contextmanager
+    def lease(self):
+        if self.closed:
+            raise RuntimeError("BrowserPool is closed")
+
+        driver = self.idle.get(timeout = self.lease_timeout)
+        try:
+            if driver is not None and not self.healthy(driver):
+                self.quit_driver(driver)
+                with self.lock:
+                    self.replaced += 1
+                driver = None
+            if driver is None:
+                driver = self.start_driver()
+        except BaseException:
+            self.idle.put(None)
+            raise
+
+        broken = False
+        try:
+            yield driver
+        except WebDriverException:
+            # Timed out or crashed mid page, the next lease gets a fresh browser rather than this one's leftover state
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken)
+
+    def release(self, driver, broken):
+        with self.lock:
+            self.uses[driver] = self.uses.get(driver, 0) + 1
+            worn_out = self.uses[driver] >= self.recycle_after
+
+            if broken:
+                self.replaced += 1
+            elif worn_out:
+                self.recycled += 1
+
+        if broken or worn_out or self.closed:
+            self.quit_driver(driver)
+            driver = None
+
+        self.idle.put(driver)
+
+    def close(self):
+        # Quits idle and leased browsers alike, a lease still running fails on its next driver call
+        self.closed = True
+        with self.lock:
+            drivers = list(self.drivers)
+        for driver in drivers:
+            self.quit_driver(driver)
+
+    def stats(self):
+        return {"size": self.size, "started": self.started, "recycled": self.recycled, "replaced": self.replaced}
@@ -0,0 +1,83 @@
+import os
+import json
+
+
+class EvidenceWriter():
+
+    # One JSON record per line, appended as each claim finishes. flush + fsync every checkpoint_every records,
+    # so a crash loses at most that many claims and never corrupts the ones before them.
+    def __init__(self, path, checkpoint_every = 10):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.pending = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+        self.drop_partial_line()
+        self.file = open(path, "a", encoding = "utf-8")
+
+    def drop_partial_line(self):
+        # A crash in the middle of a write leaves a line without its newline, appending after it would corrupt the next record too
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "rb+") as file:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            if size == 0:
+                return
+
+            file.seek(size - 1)
+            if file.read(1) == b"\n":
+                return
+
+            position = size - 1
+            while position > 0:
+                step = min(65536, position)
+                file.seek(position - step)
+                chunk = file.read(step)
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+
+            file.truncate(max(0, position))
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.pending += 1
+
+        if self.pending >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.checkpoint()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_evidence(path):
+    # Records of an EvidenceWriter file one at a time, a partial last line from a crash is skipped
+    if not os.path.exists(path):
+        return
+
+    with open(path, "r", encoding = "utf-8") as file:
+        for line in file:
+            if not line.endswith("\n"):
+                break
+            yield json.loads(line)
+
+
+def completed_claims(path):
+    return {record["claim"] for record in read_evidence(path)}
@@ -0,0 +1,112 @@
+import time
+import threading
+import multiprocessing
+
+import requests
+import trafilatura
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+PAGE_FIELDS = ["date", "author", "text", "language", "url", "hostname"]
+
+
+def extract_page(html):
+    # Runs inside the extraction pool, only the html string and a plain dict cross the process boundary
+    page_content = trafilatura.bare_extraction(html)
+
+    if page_content is None:
+        return {}
+    if not isinstance(page_content, dict):
+        # trafilatura >= 1.9 returns a Document instead of a dict
+        page_content = page_content.as_dict()
+
+    return {field: page_content.get(field) for field in PAGE_FIELDS}
+
+
+class PageFetcher():
+
+    # Downloads every search hit of a query at once over keep-alive connections, at most per_host requests
+    # to the same host at a time, and gives up on whatever is still running after deadline seconds
+    def __init__(self,
+                 headers,
+                 timeout = 10,
+                 workers = 8,
+                 per_host = 2,
+                 deadline = 30,
+                 extract_workers = None,
+                 verify = False):
+        self.timeout = timeout
+        self.per_host = per_host
+        self.deadline = deadline
+        self.verify = verify
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections = workers, pool_maxsize = workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.pool = ThreadPoolExecutor(max_workers = workers)
+
+        # trafilatura is pure Python and holds the GIL, so it runs in processes. extract_workers = 0 extracts in the download threads.
+        # spawn, a fork of a process with live download threads can inherit a held lock
+        if extract_workers == 0:
+            self.extract_pool = None
+        else:
+            self.extract_pool = ProcessPoolExecutor(max_workers = extract_workers, mp_context = multiprocessing.get_context("spawn"))
+
+        self.host_lock = threading.Lock()
+        self.host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+
+    def host_slot(self, url):
+        with self.host_lock:
+            return self.host_slots[urlsplit(url).netloc.lower()]
+
+    def download(self, url, deadline_at):
+        slot = self.host_slot(url)
+        if not slot.acquire(timeout = max(0, deadline_at - time.monotonic())):
+            raise TimeoutError(f"No free connection to {urlsplit(url).netloc} before the deadline")
+
+        try:
+            page_raw = self.session.get(url, timeout = min(self.timeout, max(0.1, deadline_at - time.monotonic())), verify = self.verify)
+        finally:
+            slot.release()
+
+        if page_raw.status_code == 400:
+            raise requests.HTTPError(f"400 Bad Request for {url}")
+        return page_raw.text
+
+    def visit(self, url, deadline_at):
+        html = self.download(url, deadline_at)
+
+        if self.extract_pool is None:
+            return extract_page(html)
+        return self.extract_pool.submit(extract_page, html).result(timeout = max(0, deadline_at - time.monotonic()))
+
+    def fetch_all(self, urls):
+        # Same page_content dicts as EvidenceSearch.visit_content, in the order of urls, {} for every failed or late page
+        deadline_at = time.monotonic() + self.deadline
+        futures = [self.pool.submit(self.visit, url, deadline_at) for url in urls]
+        wait(futures, timeout = self.deadline)
+
+        page_contents = []
+        for url, future in zip(urls, futures):
+            try:
+                page_contents.append(future.result(timeout = 0))
+            except Exception:
+                # Still running past the deadline, or the download / extraction failed
+                future.cancel()
+                print("timeout")
+                print(url)
+                page_contents.append({})
+
+        return page_contents
+
+    def close(self):
+        self.pool.shutdown(wait = False, cancel_futures = True)
+        if self.extract_pool is not None:
+            self.extract_pool.shutdown(wait = False, cancel_futures = True)
+        self.session.close()
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid")
+
+
+def normalize_url(url):
+    # Same page, same key: lower-case scheme and host, no fragment, no tracking parameters, parameters in a fixed order
+    parts = urlsplit(url.strip())
+    params = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values = True) if not key.startswith(TRACKING_PARAMS))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", urlencode(params), ""))
+
+
+class ResponseCache():
+
+    # SERP html and extracted article dicts on disk. The sqlite index maps normalized url + lang to the sha256 of the
+    # content, and every distinct content is stored once, compressed, however many urls served it.
+    # Entries expire after ttl seconds, and the least recently used ones are evicted once the blobs pass max_bytes.
+    # offline = True serves expired entries too and never evicts, to replay a recorded crawl without network.
+    def __init__(self,
+                 directory,
+                 ttl = 7 * 24 * 3600,
+                 max_bytes = 2 * 1024 ** 3,
+                 offline = False):
+        self.directory = directory
+        self.blob_directory = os.path.join(directory, "blobs")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        os.makedirs(self.blob_directory, exist_ok = True)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread = False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, digest TEXT, stored_at REAL, accessed_at REAL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest)")
+        self.connection.commit()
+
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "deduplicated": 0, "evictions": 0}
+
+    def entry_key(self, namespace, url, lang):
+        return hashlib.sha256(f"{namespace}|{lang}|{normalize_url(url)}".encode()).hexdigest()
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_directory, digest[:2], digest)
+
+    def get(self, namespace, url, lang):
+        key = self.entry_key(namespace, url, lang)
+        now = time.time()
+
+        with self.lock:
+            row = self.connection.execute("SELECT digest, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and not self.offline and now - row[1] > self.ttl:
+                self.counters["expired"] += 1
+                self.delete_entries([key])
+                self.connection.commit()
+                row = None
+
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+
+            self.connection.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+
+        try:
+            with open(self.blob_path(row[0]), "rb") as file:
+                value = json.loads(zlib.decompress(file.read()))
+        except (OSError, zlib.error, ValueError):
+            # Blob removed or damaged outside the cache, treated as never stored
+            with self.lock:
+                self.counters["misses"] += 1
+                self.delete_entries([key])
+                self.connection.commit()
+            return None
+
+        with self.lock:
+            self.counters["hits"] += 1
+        return value
+
+    def put(self, namespace, url, lang, value):
+        data = json.dumps(value, sort_keys = True).encode()
+        digest = hashlib.sha256(data).hexdigest()
+        key = self.entry_key(namespace, url, lang)
+        now = time.time()
+
+        with self.lock:
+            known = self.connection.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone() is not None
+            if known:
+                self.counters["deduplicated"] += 1
+            else:
+                path = self.blob_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok = True)
+                compressed = zlib.compress(data)
+                # Written under another name first, a reader never sees half a blob
+                with open(path + ".tmp", "wb") as file:
+                    file.write(compressed)
+                os.replace(path + ".tmp", path)
+                self.connection.execute("INSERT INTO blobs (digest, size) VALUES (?, ?)", (digest, len(compressed)))
+
+            previous = self.connection.execute("SELECT digest FROM entries WHERE key = ?", (key,)).fetchone()
+            self.connection.execute("INSERT OR REPLACE INTO entries (key, digest, stored_at, accessed_at) VALUES (?, ?, ?, ?)", (key, digest, now, now))
+            if previous is not None and previous[0] != digest:
+                self.drop_unreferenced_blob(previous[0])
+
+            self.counters["stores"] += 1
+            if not self.offline:
+                self.evict()
+            self.connection.commit()
+
+    def total_bytes(self):
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def evict(self):
+        total = self.total_bytes()
+        while total > self.max_bytes:
+            keys = [row[0] for row in self.connection.execute("SELECT key FROM entries ORDER BY accessed_at LIMIT 64")]
+            if len(keys) == 0:
+                break
+
+            # Oldest first, one at a time, and only until the blobs fit again
+            for key in keys:
+                total -= self.delete_entries([key])
+                self.counters["evictions"] += 1
+                if total <= self.max_bytes:
+                    break
+
+    def delete_entries(self, keys):
+        # Returns the blob bytes freed, a blob still referenced by another entry stays
+        freed = 0
+        for key in keys:
+            row = self.connection.execute("SELECT digest FROM entries WHERE key = ?", (key,)).fetchone()
+            self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            if row is not None:
+                freed += self.drop_unreferenced_blob(row[0])
+        return freed
+
+    def drop_unreferenced_blob(self, digest):
+        if self.connection.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone() is not None:
+            return 0
+
+        row = self.connection.execute("SELECT size FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        self.connection.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        try:
+            os.remove(self.blob_path(digest))
+        except OSError:
+            pass
+        return row[0] if row is not None else 0
+
+    def stats(self):
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            blobs = self.connection.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+            return {**self.counters, "entries": entries, "blobs": blobs, "bytes": self.total_bytes()}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,131 @@
+import warnings
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+# A Google result block, its title, its cite breadcrumb and the link to the page
+RESULT_CLASS = "MjjYud"
+TITLE_CLASS = "DKV0Md"
+LINK_JSNAME = "UWckNb"
+
+
+def result_hit(title, cite, source, source_url):
+    return {
+        "title": title,
+        "root_url": cite.split(" › ")[0],
+        "source": source,
+        "source_url": source_url,
+    }
+
+
+def parse_bs4(html, max_results):
+    from bs4 import BeautifulSoup
+
+    hits = []
+    contents = BeautifulSoup(html, "html.parser")
+    for i_cts, cts in enumerate(contents.find_all("div", attrs={'class': RESULT_CLASS})):
+        title = cts.find_all("h3", attrs={'class': TITLE_CLASS})
+        cite = cts.find("cite")
+        spans = cts.find_all("span")
+        links = cts.find_all("a", attrs={"jsname": LINK_JSNAME})
+
+        if len(title) > 0 and cite is not None and len(spans) > 0 and len(links) > 0:
+            hits.append(result_hit(title[0].text, cite.text, spans[0].text, links[0]["href"]))
+
+        if i_cts >= max_results:
+            break
+    return hits
+
+
+def parse_lxml(html, max_results):
+    import lxml.html
+
+    def has_class(name):
+        return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+    hits = []
+    contents = lxml.html.fromstring(html)
+    for i_cts, cts in enumerate(contents.xpath(f"//div[{has_class(RESULT_CLASS)}]")):
+        title = cts.xpath(f".//h3[{has_class(TITLE_CLASS)}]")
+        cite = cts.xpath(".//cite")
+        spans = cts.xpath(".//span")
+        links = cts.xpath(f".//a[@jsname='{LINK_JSNAME}']/@href")
+
+        if len(title) > 0 and len(cite) > 0 and len(spans) > 0 and len(links) > 0:
+            hits.append(result_hit(title[0].text_content(), cite[0].text_content(), spans[0].text_content(), str(links[0])))
+
+        if i_cts >= max_results:
+            break
+    return hits
+
+
+def parse_selectolax(html, max_results):
+    from selectolax.lexbor import LexborHTMLParser
+
+    hits = []
+    contents = LexborHTMLParser(html)
+    for i_cts, cts in enumerate(contents.css(f"div.{RESULT_CLASS}")):
+        title = cts.css_first(f"h3.{TITLE_CLASS}")
+        cite = cts.css_first("cite")
+        span = cts.css_first("span")
+        link = cts.css_first(f'a[jsname="{LINK_JSNAME}"]')
+
+        if title is not None and cite is not None and span is not None and link is not None and link.attributes.get("href") is not None:
+            hits.append(result_hit(title.text(), cite.text(), span.text(), link.attributes["href"]))
+
+        if i_cts >= max_results:
+            break
+    return hits
+
+
+SERP_PARSERS = {"bs4": parse_bs4, "lxml": parse_lxml, "selectolax": parse_selectolax}
+
+
+def get_serp_parser(name):
+    # Every parser returns the same hits, lxml and selectolax are only faster. A missing one falls back to BeautifulSoup.
+    try:
+        if name == "lxml":
+            import lxml.html
+        elif name == "selectolax":
+            import selectolax.lexbor
+    except ImportError:
+        warnings.warn(f"{name} is not installed, parsing result pages with BeautifulSoup")
+        return parse_bs4
+    return SERP_PARSERS[name]
+
+
+class HttpSerpBackend():
+
+    # Plain GET over pooled keep-alive connections, no browser process at all
+    def __init__(self, headers, timeout = 10, pool_size = 8):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, url):
+        page_raw = self.session.get(url, timeout = self.timeout)
+        page_raw.raise_for_status()
+        return page_raw.text
+
+    def close(self):
+        self.session.close()
+
+
+class SeleniumSerpBackend():
+
+    # A headless browser leased from the BrowserPool, for result pages that only render with JavaScript
+    def __init__(self, browser_pool):
+        self.browser_pool = browser_pool
+
+    def fetch(self, url):
+        # The browser is only held for the SERP itself and goes back to the pool before the result pages are downloaded
+        with self.browser_pool.lease() as driver:
+            driver.get(url)
+            return driver.page_source
+
+    def close(self):
+        self.browser_pool.close()
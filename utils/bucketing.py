@@ -0,0 +1,91 @@
+import torch
+from torch.utils.data import Dataset, Sampler
+
+
+class PackedDataset(Dataset):
+
+    # Token ids of every row concatenated into one flat tensor, rows are sliced out by offset and length
+    def __init__(self, input_ids, lengths, labels) -> None:
+        super(PackedDataset, self).__init__()
+        self.input_ids = input_ids
+        self.lengths = lengths
+        self.labels = labels
+        self.offsets = torch.cumsum(lengths, dim=0) - lengths
+
+    @classmethod
+    def from_padded(cls, input_ids, attention_mask, labels):
+        # Assumes right padding, which is what every tokenizer in main.py uses
+        lengths = attention_mask.sum(dim=1)
+        return cls(input_ids[attention_mask.bool()], lengths, labels)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, index):
+        offset = self.offsets[index]
+        return self.input_ids[offset:offset + self.lengths[index]], self.labels[index]
+
+
+class BucketBatchSampler(Sampler):
+
+    def __init__(self, lengths, batch_size, shuffle=False, bucket_size_multiplier=100, seed=42, num_replicas=1, rank=0) -> None:
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_size = batch_size * bucket_size_multiplier
+        self.seed = seed
+        self.epoch = 0
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def batches(self):
+        if not self.shuffle:
+            # Evaluation order does not matter for the epoch metrics, so simply sort everything by length
+            indices = torch.argsort(self.lengths, stable=True)
+            return [indices[start:start + self.batch_size].tolist() for start in range(0, len(indices), self.batch_size)]
+
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        self.epoch += 1
+
+        # Shuffle, sort inside large buckets so batches hold similar lengths, then shuffle the batch order
+        indices = torch.randperm(len(self.lengths), generator=generator)
+        batches = []
+        for start in range(0, len(indices), self.bucket_size):
+            bucket = indices[start:start + self.bucket_size]
+            bucket = bucket[torch.argsort(self.lengths[bucket], stable=True)]
+            batches += [bucket[i:i + self.batch_size].tolist() for i in range(0, len(bucket), self.batch_size)]
+
+        return [batches[i] for i in torch.randperm(len(batches), generator=generator).tolist()]
+
+    def __iter__(self):
+        batches = self.batches()
+        if self.num_replicas > 1:
+            # Every rank draws the same seeded batch order and takes every num_replicas-th batch, the list is
+            # padded with batches from its start so all ranks run the same number of steps
+            total = len(self) * self.num_replicas
+            while len(batches) < total:
+                batches += batches[:total - len(batches)]
+            batches = batches[self.rank::self.num_replicas]
+
+        yield from batches
+
+    def __len__(self):
+        num_batches = (len(self.lengths) + self.batch_size - 1) // self.batch_size
+        return (num_batches + self.num_replicas - 1) // self.num_replicas
+
+
+def pad_collate(batch, pad_token_id=0):
+    sequences, labels = zip(*batch)
+    max_length = max(len(sequence) for sequence in sequences)
+
+    input_ids = torch.full((len(sequences), max_length), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), max_length), dtype=torch.long)
+    for i, sequence in enumerate(sequences):
+        input_ids[i, :len(sequence)] = sequence
+        attention_mask[i, :len(sequence)] = 1
+
+    return input_ids, attention_mask, torch.stack(labels)
@@ -0,0 +1,43 @@
+import re
+import multiprocessing
+import pandas as pd
+
+# Same patterns and order as TwitterDataModule.clean_tweet, compiled once
+MENTION_PATTERN = re.compile(r'@\w+')
+LINK_PATTERN = re.compile(r'http\S+')
+NUMBER_PATTERN = re.compile(r'\d+')
+NON_ALPHABET_PATTERN = re.compile(r'[^a-zA-Z ]')
+
+
+def clean_text_series(texts, stop_words):
+    stop_words = frozenset(stop_words)
+
+    result = texts.str.lower()
+    result = result.str.replace(MENTION_PATTERN, 'user', regex=True)  # remove user mention
+    result = result.str.replace(LINK_PATTERN, '', regex=True)  # remove links
+    result = result.str.replace(NUMBER_PATTERN, '', regex=True)  # remove numbers
+    result = result.str.replace(NON_ALPHABET_PATTERN, '', regex=True)  # keep only alphabets
+    result = result.map(lambda text: ' '.join([word for word in text.split() if word not in stop_words]), na_action='ignore')  # remove stopwords
+    result = result.str.strip()
+
+    return result.mask(result == '')
+
+
+def _clean_chunk(args):
+    texts, stop_words = args
+    return clean_text_series(texts, stop_words)
+
+
+def clean_text_series_parallel(texts, stop_words, num_workers=None, chunk_size=20000):
+    # Only worth it for very large corpora, process start-up and pickling dominate on small ones
+    if len(texts) <= chunk_size:
+        return clean_text_series(texts, stop_words)
+
+    num_workers = num_workers or multiprocessing.cpu_count()
+    stop_words = frozenset(stop_words)
+    chunks = [(texts.iloc[start:start + chunk_size], stop_words) for start in range(0, len(texts), chunk_size)]
+
+    with multiprocessing.Pool(processes=num_workers) as pool:
+        results = pool.map(_clean_chunk, chunks)
+
+    return pd.concat(results)
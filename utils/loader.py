@@ -0,0 +1,75 @@
+import os
+import time
+import torch
+import torch.distributed as dist
+from torch.utils.data import BatchSampler, DistributedSampler, IterableDataset, RandomSampler, SequentialSampler
+
+
+def distributed_context():
+    # (rank, world_size) of this process, (0, 1) outside a process group
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_rank(), dist.get_world_size()
+    return 0, 1
+
+
+def row_sampler(dataset, shuffle=False, num_replicas=1, rank=0, seed=42):
+    if num_replicas > 1:
+        # Every rank gets an equal, disjoint share of the rows, padded with repeats like any DistributedSampler
+        return DistributedSampler(dataset, num_replicas=num_replicas, rank=rank, shuffle=shuffle, seed=seed)
+    return RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+
+
+class EpochBatchSampler(BatchSampler):
+
+    # Lightning calls set_epoch on the DataLoader sampler, pass it on so the wrapped DistributedSampler reshuffles every epoch
+    def set_epoch(self, epoch):
+        if hasattr(self.sampler, 'set_epoch'):
+            self.sampler.set_epoch(epoch)
+
+
+def tensor_batch_sampler(dataset, batch_size, shuffle=False, num_replicas=1, rank=0, seed=42):
+    # Used as the DataLoader sampler with batch_size=None, so TensorDataset is indexed with a whole
+    # batch of indices at once instead of being collated row by row
+    return EpochBatchSampler(row_sampler(dataset, shuffle, num_replicas, rank, seed), batch_size, drop_last=False)
+
+
+def measure_fetch_time(dataloader, num_batches=20):
+    iterator = iter(dataloader)
+    start = time.perf_counter()
+    fetched = 0
+    for _ in range(num_batches):
+        try:
+            next(iterator)
+        except StopIteration:
+            break
+        fetched += 1
+    return (time.perf_counter() - start) / max(fetched, 1)
+
+
+def resolve_num_workers(num_workers, dataloader=None, threshold=0.005, max_workers=8, streaming_workers=2):
+    if num_workers != 'auto':
+        return int(num_workers)
+
+    # Timing a streaming dataset in-process would mostly time filling its shuffle buffer and would advance its epoch.
+    # A couple of workers overlap shard reads with training, every further one holds its own shard and buffer in memory.
+    if isinstance(getattr(dataloader, 'dataset', None), IterableDataset):
+        return min(streaming_workers, os.cpu_count() or 1)
+
+    # Batches that are cheap to build in-process are not worth forking workers for
+    fetch_time = measure_fetch_time(dataloader)
+    if fetch_time <= threshold:
+        return 0
+
+    return min(max_workers, os.cpu_count() or 1)
+
+
+def resolve_pin_memory(pin_memory):
+    if pin_memory is None:
+        return torch.cuda.is_available()
+    return pin_memory
+
+
+def worker_options(num_workers, persistent_workers=True, prefetch_factor=2):
+    if num_workers == 0:
+        return {}
+    return {'persistent_workers': persistent_workers, 'prefetch_factor': prefetch_factor}
@@ -313,15 +313,53 @@
 import os
 import re
 import torch
+from functools import partial
 import pandas as pd
 import pytorch_lightning as pl
 from tqdm import tqdm
-from torch.utils.data import TensorDataset, DataLoader
+from torch.utils.data import TensorDataset, DataLoader, IterableDataset
 from Sastrawi.StopWordRemover.StopWordRemoverFactory import StopWordRemoverFactory
+from torch.nn import functional as F
+from utils.tensor_cache import TensorCache, build_cache_key, hash_files, hash_tokenizer
+from utils.bucketing import PackedDataset, BucketBatchSampler, pad_collate
+from utils.loader import distributed_context, row_sampler, tensor_batch_sampler, resolve_num_workers, resolve_pin_memory, worker_options
+from utils.streaming import ShardWriter, ShardedDataset, manifest_path, read_csv_chunks
+from utils.processed_store import processed_path, read_processed, write_processed
+from utils.cleaner import clean_text_series, clean_text_series_parallel
+from utils.tokenization import encode_slow, encode_batched, get_fast_tokenizer, mismatched_rows
+
+STEPS = ['train', 'validation', 'test']
+STAGE_STEPS = {'fit': ['train', 'validation'], 'validate': ['validation'], 'test': ['test'], 'predict': ['test']}
 
 class TwitterDataModule(pl.LightningDataModule):
 
-    def __init__(self, tokenizer, max_length=128, batch_size=32, recreate=False, one_hot_label=False) -> None:
+    # Bump this whenever clean_tweet or the Headline/[SEP] composition changes, it invalidates the tensor cache
+    CLEAN_TWEET_VERSION = 1
+
+    def __init__(self,
+                 tokenizer,
+                 max_length=128,
+                 batch_size=32,
+                 recreate=False,
+                 one_hot_label=False,
+                 cache_dir="datasets/cache",
+                 tokenize_mode="slow",
+                 tokenize_chunk_size=2048,
+                 clean_mode="vectorized",
+                 clean_workers=None,
+                 padding_mode="max_length",
+                 bucket_size_multiplier=100,
+                 num_workers="auto",
+                 pin_memory=None,
+                 persistent_workers=True,
+                 prefetch_factor=2,
+                 streaming=False,
+                 shard_dir="datasets/shards",
+                 shard_size=4096,
+                 shuffle_buffer_size=10000,
+                 read_chunk_size=10000,
+                 processed_format="csv",
+                 ) -> None:
         super(TwitterDataModule, self).__init__()
         self.seed = 42
         self.tokenizer = tokenizer
@@ -329,6 +367,32 @@ class TwitterDataModule(pl.LightningDataModule):
         self.batch_size = batch_size
         self.recreate = recreate
         self.one_hot_label = one_hot_label
+        self.cache_dir = cache_dir
+        self.tokenize_mode = tokenize_mode
+        self.tokenize_chunk_size = tokenize_chunk_size
+        self.parity_check_rows = 64
+        self.clean_mode = clean_mode
+        self.clean_workers = clean_workers
+        self.padding_mode = padding_mode
+        self.bucket_size_multiplier = bucket_size_multiplier
+        self.num_workers = num_workers
+        self.pin_memory = pin_memory
+        self.persistent_workers = persistent_workers
+        self.prefetch_factor = prefetch_factor
+        self.auto_num_workers = {}
+        self.streaming = streaming
+        self.shard_dir = shard_dir
+        self.shard_size = shard_size
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.read_chunk_size = read_chunk_size
+        self.processed_format = processed_format
+        self.data_cache_key = None
+        self.processed_dataset = None
+        self.encoder = None
+        self.tensor_datasets = {}
+        self.splits = {}
+        if streaming and padding_mode == 'dynamic':
+            raise ValueError('Streaming shards are stored padded to max_length, dynamic padding is not supported with streaming')
         # self.train_dataset_path = "datasets/train.csv"
         # self.validation_dataset_path = "datasets/validation.csv"
         # self.test_dataset_path = "datasets/test.csv"
@@ -345,11 +409,121 @@ class TwitterDataModule(pl.LightningDataModule):
         self.validation_dataset_path = "datasets/GithubTest/validation.csv"
         self.test_dataset_path = "datasets/GithubTest/test.csv"
         self.processed_dataset_path = "datasets/twitter_label_manual_processed.csv"
+
+    def cache_key(self):
+        # Hashing the CSVs reads them fully, so do it once per process
+        if self.data_cache_key is not None:
+            return self.data_cache_key
+
+        # Without recreate the tensors come from the shared processed file, which may have been cleaned from other CSVs
+        processed = processed_path(self.processed_dataset_path, self.processed_format)
+        processed_source = None
+        if os.path.exists(processed) and not self.recreate:
+            processed_source = {'format': self.processed_format, 'data': hash_files([processed])}
+
+        self.data_cache_key = build_cache_key(
+            tokenizer_name=getattr(self.tokenizer, 'name_or_path', type(self.tokenizer).__name__),
+            tokenizer_vocab=hash_tokenizer(self.tokenizer),
+            max_length=self.max_length,
+            tokenize_mode=self.tokenize_mode,
+            one_hot_label=self.one_hot_label,
+            clean_tweet_version=self.CLEAN_TWEET_VERSION,
+            data=hash_files([self.train_dataset_path, self.validation_dataset_path, self.test_dataset_path]),
+            processed=processed_source,
+        )
+        return self.data_cache_key
+
+    def tensor_cache(self):
+        return TensorCache(self.cache_dir, self.cache_key())
+
+    def prepare_shards(self, steps=STEPS):
+        # Clean and tokenize the CSVs chunk by chunk into fixed-size shards, nothing larger than a chunk is kept in memory
+        root = os.path.join(self.shard_dir, self.cache_key())
+        os.makedirs(root, exist_ok=True)
+        self.stop_words = StopWordRemoverFactory().get_stop_words()
+
+        dataset_paths = {'train': self.train_dataset_path, 'validation': self.validation_dataset_path, 'test': self.test_dataset_path}
+        for step in steps:
+            if os.path.exists(manifest_path(root, step)):
+                continue
+
+            path = dataset_paths[step]
+
+            print(f'[ Writing {step} Shards ]')
+            writer = ShardWriter(root, step, self.shard_size)
+            for chunk in read_csv_chunks(path, self.read_chunk_size):
+                chunk["text"] = self.clean_texts(chunk["text"])
+                chunk = chunk.dropna(subset=['text'])
+                if len(chunk) == 0:
+                    continue
+
+                if self.encoder is None:
+                    self.encoder = self.get_encoder(chunk)
+
+                input_ids, attention_mask = self.encoder(self.compose_texts(chunk))
+                writer.add(input_ids, attention_mask, self.encode_labels(chunk['label']))
+
+            manifest = writer.close()
+            print(f'[ Wrote {manifest["rows"]} Rows In {len(manifest["shards"])} Shards ]\n')
+
+        return root
+
     def load_data(self):
+        return tuple(self.load_split(step) for step in STEPS)
+
+    def load_split(self, step):
+        # Each split is cleaned and tokenized at most once per process, later stages reuse it
+        if step not in self.tensor_datasets:
+            self.tensor_datasets[step] = self.build_split(step)
+        return self.tensor_datasets[step]
+
+    def build_split(self, step):
+        # Reuse tokenized tensors from a previous run with the same tokenizer, max_length, labels and data
+        cache = self.tensor_cache() if self.cache_dir is not None else None
+        if cache is not None and cache.exists([step]):
+            print(f'[ Loading Cached {step} Tensors ({cache.key}) ]')
+            tensors = cache.load(step)
+            print('[ Load Completed ]\n')
+            return TensorDataset(tensors['input_ids'], tensors['attention_mask'], tensors['labels'])
+
+        dataset = self.get_processed_dataset(step)
+
+        print(f'[ Tokenizing {step} Dataset ]')
+
+        if self.encoder is None:
+            self.encoder = self.get_encoder(dataset)
+
+        input_ids, attention_mask = self.encoder(self.compose_texts(dataset))
+        labels = self.encode_labels(dataset['label'])
+
+        print('[ Tokenize Completed ]\n')
+
+        if cache is not None:
+            print(f'[ Saving {step} Tensor Cache ({cache.key}) ]')
+            cache.save(step, {'input_ids': input_ids, 'attention_mask': attention_mask, 'labels': labels})
+            print('[ Save Completed ]\n')
+
+        return TensorDataset(input_ids, attention_mask, labels)
+
+    def get_processed_dataset(self, step):
+        path = processed_path(self.processed_dataset_path, self.processed_format)
+
+        # recreate only forces the cleaning pass once per process, the cleaned frame is kept for the other splits
+        if self.processed_dataset is None:
+            if self.recreate or not os.path.exists(path):
+                self.processed_dataset = self.load_processed_dataset()
+            else:
+                return self.load_processed_dataset(steps=[step])
+
+        return self.processed_dataset[self.processed_dataset['step'] == step]
+
+    def load_processed_dataset(self, steps=None):
+        path = processed_path(self.processed_dataset_path, self.processed_format)
+
         # Load dataset if exists, else preprocess and save
-        if os.path.exists(self.processed_dataset_path) and not self.recreate:
+        if os.path.exists(path) and not self.recreate:
             print('[ Loading Dataset ]')
-            dataset = pd.read_csv(self.processed_dataset_path)
+            dataset = read_processed(path, self.processed_format, columns=["text", "Headline", "label", "step"], steps=steps)
             print('[ Load Completed ]\n')
         else:
             print('[ Preprocessing Dataset ]')
@@ -370,77 +544,60 @@ class TwitterDataModule(pl.LightningDataModule):
             self.stop_words = StopWordRemoverFactory().get_stop_words()
 
             # Clean and preprocess the 'text' column
-            tqdm.pandas(desc='Preprocessing')
-            dataset["text"] = dataset["text"].progress_apply(lambda x: self.clean_tweet(x))
+            dataset["text"] = self.clean_texts(dataset["text"])
             dataset.dropna(subset=['text'], inplace=True)
             print('[ Preprocess Completed ]\n')
 
             print('[ Saving Preprocessed Dataset ]')
-            # Save the preprocessed dataset to a CSV file
-            dataset.to_csv(self.processed_dataset_path, index=False)
+            # Save the preprocessed dataset to a CSV or Parquet file
+            write_processed(dataset, path, self.processed_format)
             print('[ Save Completed ]\n')
 
-        print('[ Tokenizing Dataset ]')
-
-        # Initialize lists for tokenized inputs, attention masks, and labels
-        train_x_input_ids, train_x_attention_mask, train_y = [], [], []
-        valid_x_input_ids, valid_x_attention_mask, valid_y = [], [], []
-        test_x_input_ids, test_x_attention_mask, test_y = [], [], []
-
-        for (text, Headline, label, step) in tqdm(dataset.values.tolist()):
-            # Combine headline and text
-            combined_text = f"{Headline} [SEP] {text}"
-
-            # One-hot encode labels if specified
-            if self.one_hot_label:
-                default = [0]*2
-                default[label] = 1
-                label = default 
-
-            # Tokenize the combined text using the provided tokenizer
-            encoded_text = self.tokenizer.encode_plus(
-                combined_text,
-                max_length=self.max_length,
-                padding="max_length",
-                truncation=True,
-                return_tensors='pt'  # Return PyTorch tensors
-            )
-            
-            # Append the tokenized input, attention mask, and label to the corresponding lists based on the source
-            if step == 'train':
-                train_x_input_ids.append(encoded_text['input_ids'].squeeze(0))  # Remove the batch dimension
-                train_x_attention_mask.append(encoded_text['attention_mask'].squeeze(0))
-                train_y.append(label)
-            elif step == 'validation':
-                valid_x_input_ids.append(encoded_text['input_ids'].squeeze(0))
-                valid_x_attention_mask.append(encoded_text['attention_mask'].squeeze(0))
-                valid_y.append(label)
-            elif step == 'test':
-                test_x_input_ids.append(encoded_text['input_ids'].squeeze(0))
-                test_x_attention_mask.append(encoded_text['attention_mask'].squeeze(0))
-                test_y.append(label)
-
-        # Convert lists to PyTorch tensors
-        train_x_input_ids = torch.stack(train_x_input_ids)
-        train_x_attention_mask = torch.stack(train_x_attention_mask)
-        train_y = torch.tensor(train_y).float()
-
-        valid_x_input_ids = torch.stack(valid_x_input_ids)
-        valid_x_attention_mask = torch.stack(valid_x_attention_mask)
-        valid_y = torch.tensor(valid_y).float()
-
-        test_x_input_ids = torch.stack(test_x_input_ids)
-        test_x_attention_mask = torch.stack(test_x_attention_mask)
-        test_y = torch.tensor(test_y).float()
-
-        # Create TensorDatasets for train, validation, and test sets
-        train_dataset = TensorDataset(train_x_input_ids, train_x_attention_mask, train_y)
-        valid_dataset = TensorDataset(valid_x_input_ids, valid_x_attention_mask, valid_y)
-        test_dataset = TensorDataset(test_x_input_ids, test_x_attention_mask, test_y)
+            if steps is not None:
+                dataset = dataset[dataset['step'].isin(steps)]
 
-        print('[ Tokenize Completed ]\n')
+        return dataset
+
+    def get_encoder(self, dataset):
+        if self.tokenize_mode == 'slow':
+            return lambda texts: encode_slow(self.tokenizer, texts, self.max_length)
+
+        fast_tokenizer = get_fast_tokenizer(self.tokenizer)
+        if fast_tokenizer is None:
+            print('[ No Fast Tokenizer Available, Falling Back To Slow Tokenizer ]')
+            return lambda texts: encode_slow(self.tokenizer, texts, self.max_length)
+
+        # Batched runs have their own cache key, the spot check keeps a fast tokenizer that disagrees early from being used at all
+        sample = self.compose_texts(dataset.iloc[:self.parity_check_rows])
+        mismatches = mismatched_rows(self.tokenizer, fast_tokenizer, sample, self.max_length)
+        if len(mismatches) > 0:
+            print(f'[ Fast Tokenizer Mismatch On {len(mismatches)} Rows, Falling Back To Slow Tokenizer ]')
+            return lambda texts: encode_slow(self.tokenizer, texts, self.max_length)
+
+        return lambda texts: encode_batched(fast_tokenizer, texts, self.max_length, chunk_size=self.tokenize_chunk_size)
 
-        return train_dataset, valid_dataset, test_dataset
+    def compose_texts(self, dataset):
+        # Combine headline and text
+        return [f"{Headline} [SEP] {text}" for text, Headline in zip(dataset['text'], dataset['Headline'])]
+
+    def encode_labels(self, labels):
+        labels = torch.tensor(labels.to_numpy(dtype='int64'))
+
+        # One-hot encode labels if specified
+        if self.one_hot_label:
+            return F.one_hot(labels, num_classes=2).float()
+
+        return labels.float()
+
+    def clean_texts(self, texts):
+        # 'apply' runs clean_tweet row by row, 'vectorized' and 'parallel' produce the same output from compiled patterns
+        if self.clean_mode == 'vectorized':
+            return clean_text_series(texts, self.stop_words)
+        elif self.clean_mode == 'parallel':
+            return clean_text_series_parallel(texts, self.stop_words, num_workers=self.clean_workers)
+
+        tqdm.pandas(desc='Preprocessing')
+        return texts.progress_apply(lambda x: self.clean_tweet(x))
 
     def clean_tweet(self, tweet):
         result = tweet.lower()
@@ -456,33 +613,87 @@ class TwitterDataModule(pl.LightningDataModule):
 
         return result
 
+    def prepare_data(self):
+        # Lightning runs this on one process per node before setup, so under DDP the cache or shards are written
+        # once and every rank's setup only loads them. A single process keeps building splits lazily in setup.
+        if self.trainer is None or self.trainer.world_size == 1:
+            return
+
+        if self.streaming:
+            self.prepare_shards()
+        elif self.cache_dir is not None:
+            self.load_data()
+
     def setup(self, stage=None):
-        # Load datasets during the setup phase
-        train_data, valid_data, test_data = self.load_data()
-        if stage == "fit":
-            self.train_data = train_data
-            self.valid_data = valid_data
-        elif stage == "test":
-            self.test_data = test_data
+        # Only prepare the splits the stage needs, setup("test") reuses what setup("fit") already built
+        steps = STAGE_STEPS.get(stage, STEPS)
+        if 'train' in steps:
+            self.train_data = self.get_split('train')
+        if 'validation' in steps:
+            self.valid_data = self.get_split('validation')
+        if 'test' in steps:
+            self.test_data = self.get_split('test')
+
+    def get_split(self, step):
+        if step in self.splits:
+            return self.splits[step]
+
+        if self.streaming:
+            root = self.prepare_shards([step])
+            rank, world_size = distributed_context()
+            data = ShardedDataset(root, step, shuffle=(step == 'train'), shuffle_buffer_size=self.shuffle_buffer_size, seed=self.seed, num_replicas=world_size, rank=rank)
+        else:
+            data = self.load_split(step)
+            if self.padding_mode == 'dynamic':
+                data = PackedDataset.from_padded(*data.tensors)
+
+        self.splits[step] = data
+        return data
+
+    def build_dataloader(self, dataset, shuffle=False, num_workers=None):
+        if num_workers is None:
+            num_workers = self.resolve_num_workers(dataset)
+
+        # Under DDP every sampler below hands this rank its own share, Lightning's sampler replacement is turned off in main.py
+        rank, world_size = distributed_context()
+
+        if self.padding_mode == 'dynamic':
+            # Group rows of similar length and pad each batch only up to its longest row
+            loader_args = {
+                'batch_sampler': BucketBatchSampler(dataset.lengths, self.batch_size, shuffle=shuffle, bucket_size_multiplier=self.bucket_size_multiplier, seed=self.seed, num_replicas=world_size, rank=rank),
+                'collate_fn': partial(pad_collate, pad_token_id=self.tokenizer.pad_token_id),
+            }
+        elif isinstance(dataset, IterableDataset):
+            # Shuffling happens inside the dataset's own buffer, the rank split inside ShardedDataset
+            loader_args = {'batch_size': self.batch_size}
+        elif num_workers == 0 and isinstance(dataset, TensorDataset):
+            loader_args = {'sampler': tensor_batch_sampler(dataset, self.batch_size, shuffle=shuffle, num_replicas=world_size, rank=rank, seed=self.seed), 'batch_size': None}
+        else:
+            loader_args = {'batch_size': self.batch_size, 'sampler': row_sampler(dataset, shuffle=shuffle, num_replicas=world_size, rank=rank, seed=self.seed)}
 
-    def train_dataloader(self):
         return DataLoader(
-            dataset=self.train_data,
-            batch_size=self.batch_size,
-            shuffle=True,
-            num_workers=os.cpu_count()
+            dataset=dataset,
+            num_workers=num_workers,
+            pin_memory=resolve_pin_memory(self.pin_memory),
+            **worker_options(num_workers, persistent_workers=self.persistent_workers, prefetch_factor=self.prefetch_factor),
+            **loader_args
         )
 
+    def resolve_num_workers(self, dataset):
+        # 'auto' times a few in-process batch fetches and only forks workers when batches are expensive to build
+        if self.num_workers == 'auto':
+            if id(dataset) not in self.auto_num_workers:
+                self.auto_num_workers[id(dataset)] = resolve_num_workers('auto', self.build_dataloader(dataset, num_workers=0))
+                print(f'[ DataLoader Workers: {self.auto_num_workers[id(dataset)]} ]')
+            return self.auto_num_workers[id(dataset)]
+
+        return resolve_num_workers(self.num_workers)
+
+    def train_dataloader(self):
+        return self.build_dataloader(self.train_data, shuffle=True)
+
     def val_dataloader(self):
-        return DataLoader(
-            dataset=self.valid_data,
-            batch_size=self.batch_size,
-            num_workers=os.cpu_count()
-        )
+        return self.build_dataloader(self.valid_data)
 
     def test_dataloader(self):
-        return DataLoader(
-            dataset=self.test_data,
-            batch_size=self.batch_size,
-            num_workers=os.cpu_count()
-        )
+        return self.build_dataloader(self.test_data)
@@ -0,0 +1,35 @@
+import os
+import pandas as pd
+
+STEPS = ['train', 'validation', 'test']
+
+
+def processed_path(path, processed_format):
+    root, _ = os.path.splitext(path)
+    return f'{root}.{processed_format}'
+
+
+def write_processed(dataset, path, processed_format='csv'):
+    if processed_format == 'csv':
+        dataset.to_csv(path, index=False)
+        return
+
+    # step is one of three values and label is 0/1, so store them as dictionary-encoded and int8 columns
+    dataset = dataset.astype({'step': pd.CategoricalDtype(STEPS), 'label': 'int8'})
+    dataset.to_parquet(path, index=False, engine='pyarrow')
+
+
+def read_processed(path, processed_format='csv', columns=None, steps=None):
+    if processed_format == 'csv':
+        dataset = pd.read_csv(path, usecols=columns)
+        if steps is not None:
+            dataset = dataset[dataset['step'].isin(steps)]
+        return dataset
+
+    import pyarrow.parquet as pq
+
+    # Only the requested columns and row groups are decoded, memory_map avoids copying the file into a read buffer
+    filters = [('step', 'in', list(steps))] if steps is not None else None
+    table = pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+
+    return table.to_pandas(self_destruct=True)
@@ -0,0 +1,101 @@
+import os
+import glob
+import time
+import warnings
+import torch
+import pytorch_lightning as pl
+
+from pytorch_lightning.callbacks import Callback
+from pytorch_lightning.strategies import DDPStrategy
+
+
+def resolve_accelerator(accelerator='auto'):
+    if accelerator != 'auto':
+        return accelerator
+    return 'gpu' if torch.cuda.is_available() else 'cpu'
+
+
+def resolve_precision(precision, accelerator):
+    if precision in ('32', 32):
+        return 32
+
+    # CPU bf16 runs under torch.autocast on any x86 host, native on AVX512-BF16/AMX and emulated (slower) elsewhere
+    if accelerator == 'gpu' and not torch.cuda.is_bf16_supported():
+        warnings.warn('This GPU has no bf16 support, training in fp32')
+        return 32
+
+    # Lightning 2 renamed the autocast bf16 mode
+    return 'bf16-mixed' if int(pl.__version__.split('.')[0]) >= 2 else 'bf16'
+
+
+def usable_cpus():
+    # Honors taskset / cgroup cpusets, os.cpu_count() would also count CPUs this process cannot run on
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def count_sockets():
+    packages = set()
+    for path in glob.glob('/sys/devices/system/cpu/cpu[0-9]*/topology/physical_package_id'):
+        with open(path) as file:
+            packages.add(file.read().strip())
+    return max(1, len(packages))
+
+
+def configure_threads(num_threads='auto', interop_threads='auto', processes=1):
+    # 'auto' spreads the intra-op pool over every usable CPU on every socket, torch's own default can stop at one socket's cores.
+    # With several training processes on the host each one gets an equal slice instead of all of them oversubscribing every core.
+    if num_threads is not None:
+        torch.set_num_threads(max(1, usable_cpus() // processes) if num_threads == 'auto' else int(num_threads))
+
+    # One inter-op thread per socket lets independent ops run side by side without oversubscribing the intra-op pools
+    if interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(max(1, count_sockets() // processes) if interop_threads == 'auto' else int(interop_threads))
+        except RuntimeError:
+            # Can only be set before the first parallel op, keep whatever is already running
+            warnings.warn('Inter-op threads were already started, keeping the current setting')
+
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def distributed_options(accelerator, devices=1, num_nodes=1, find_unused_parameters=False):
+    # Extra Trainer arguments for data-parallel training, nothing changes for a single process
+    if devices == 1 and num_nodes == 1:
+        return {}
+
+    # gloo is the collective backend that runs on CPU, nccl only works between GPUs
+    strategy = DDPStrategy(process_group_backend='gloo' if accelerator == 'cpu' else 'nccl', find_unused_parameters=find_unused_parameters)
+
+    # TwitterDataModule splits the data by rank itself, including the bucket sampler and the streaming shards
+    sampler_option = 'use_distributed_sampler' if int(pl.__version__.split('.')[0]) >= 2 else 'replace_sampler_ddp'
+
+    return {'devices': devices, 'num_nodes': num_nodes, 'strategy': strategy, sampler_option: False}
+
+
+class EpochTimer(Callback):
+
+    def __init__(self) -> None:
+        self.epoch_times = []
+        self.start = None
+
+    def on_train_epoch_start(self, trainer, pl_module):
+        self.start = time.perf_counter()
+
+    def on_train_epoch_end(self, trainer, pl_module):
+        self.epoch_times.append(time.perf_counter() - self.start)
+        pl_module.log('epoch_time', self.epoch_times[-1], prog_bar=False, on_epoch=True)
+        if trainer.is_global_zero:
+            print(f'\n[ Epoch {trainer.current_epoch} Took {self.epoch_times[-1]:.1f}s ]')
+
+
+class DatasetEpoch(Callback):
+
+    # Lightning only calls set_epoch on samplers, a streaming ShardedDataset shuffles inside the dataset itself
+    def on_train_epoch_start(self, trainer, pl_module):
+        # Lightning 1.x wraps the train DataLoader in a CombinedLoader, 2.x hands it over as is
+        loader = trainer.train_dataloader
+        dataset = getattr(getattr(loader, 'loaders', loader), 'dataset', None)
+        if hasattr(dataset, 'set_epoch'):
+            dataset.set_epoch(trainer.current_epoch)
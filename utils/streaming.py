@@ -0,0 +1,168 @@
+import os
+import json
+import random
+import torch
+import pandas as pd
+from torch.utils.data import IterableDataset, get_worker_info
+
+
+class ShardWriter():
+
+    def __init__(self, root, step, shard_size) -> None:
+        self.root = root
+        self.step = step
+        self.shard_size = shard_size
+        self.shard_paths = []
+        self.shard_rows = []
+        self.total_rows = 0
+        self.pending = []
+        self.pending_rows = 0
+
+    def add(self, input_ids, attention_mask, labels):
+        self.pending.append((input_ids, attention_mask, labels))
+        self.pending_rows += len(labels)
+
+        while self.pending_rows >= self.shard_size:
+            self.flush(self.shard_size)
+
+    def flush(self, rows=None):
+        if self.pending_rows == 0:
+            return
+
+        input_ids, attention_mask, labels = [torch.cat(tensors) for tensors in zip(*self.pending)]
+        rows = rows or self.pending_rows
+
+        path = os.path.join(self.root, f'{self.step}-{len(self.shard_paths):05d}.pt')
+        torch.save({'input_ids': input_ids[:rows].clone(), 'attention_mask': attention_mask[:rows].clone(), 'labels': labels[:rows].clone()}, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+        self.shard_paths.append(path)
+        self.shard_rows.append(rows)
+        self.total_rows += rows
+        self.pending = [(input_ids[rows:], attention_mask[rows:], labels[rows:])] if rows < len(labels) else []
+        self.pending_rows = len(labels) - rows
+
+    def close(self):
+        self.flush()
+
+        # The manifest is written last, so its presence means every shard of the split is complete
+        manifest = {'shards': [os.path.basename(path) for path in self.shard_paths], 'shard_rows': self.shard_rows, 'rows': self.total_rows}
+        with open(manifest_path(self.root, self.step), 'w') as f:
+            json.dump(manifest, f)
+
+        return manifest
+
+
+def manifest_path(root, step):
+    return os.path.join(root, f'{step}.json')
+
+
+def read_manifest(root, step):
+    with open(manifest_path(root, step), 'r') as f:
+        return json.load(f)
+
+
+def load_shard(path):
+    try:
+        return torch.load(path, mmap=True, weights_only=True)
+    except TypeError:
+        return torch.load(path)
+
+
+def read_csv_chunks(path, chunk_size):
+    return pd.read_csv(path, usecols=["text", "Headline", "label"], chunksize=chunk_size)
+
+
+class ShardedDataset(IterableDataset):
+
+    def __init__(self, root, step, shuffle=False, shuffle_buffer_size=10000, seed=42, num_replicas=1, rank=0) -> None:
+        super(ShardedDataset, self).__init__()
+        manifest = read_manifest(root, step)
+        self.shard_paths = [os.path.join(root, shard) for shard in manifest['shards']]
+        self.rows = manifest['rows']
+        self.shuffle = shuffle
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.seed = seed
+        # In shared memory, so set_epoch from the trainer also reaches persistent workers that keep their dataset copy
+        self.epoch = torch.zeros((), dtype=torch.int64).share_memory_()
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+        # Manifests written before shard_rows was recorded only need it for a distributed split
+        if 'shard_rows' in manifest:
+            self.shard_rows = manifest['shard_rows']
+        elif num_replicas > 1:
+            self.shard_rows = [len(load_shard(path)['labels']) for path in self.shard_paths]
+        else:
+            self.shard_rows = None
+
+    def set_epoch(self, epoch):
+        self.epoch.fill_(epoch)
+
+    def __len__(self):
+        return (self.rows + self.num_replicas - 1) // self.num_replicas
+
+    def segments(self):
+        # (path, start, stop) slices of the shards that hold this rank's contiguous share of the rows
+        if self.num_replicas == 1:
+            return [(path, 0, None) for path in self.shard_paths]
+
+        rows_per_rank = len(self)
+        begin = self.rank * rows_per_rank
+        end = begin + rows_per_rank
+
+        segments, offset = [], 0
+        for path, rows in zip(self.shard_paths, self.shard_rows):
+            if begin < offset + rows and offset < end:
+                segments.append((path, max(begin, offset) - offset, min(end, offset + rows) - offset))
+            offset += rows
+
+        # The last rank wraps around to the first rows, so every rank runs the same number of steps like DistributedSampler
+        missing = rows_per_rank - sum(stop - start for _, start, stop in segments)
+        for path, rows in zip(self.shard_paths, self.shard_rows):
+            if missing <= 0:
+                break
+            segments.append((path, 0, min(rows, missing)))
+            missing -= rows
+
+        return segments
+
+    def iter_rows(self, segments):
+        for path, start, stop in segments:
+            shard = load_shard(path)
+
+            for row in zip(shard['input_ids'][start:stop], shard['attention_mask'][start:stop], shard['labels'][start:stop]):
+                yield row
+
+    def __iter__(self):
+        segments = self.segments()
+
+        # worker_info.seed is fixed for the life of a persistent worker, so the epoch set by the trainer drives the order
+        worker_info = get_worker_info()
+        if worker_info is None:
+            seed = self.seed + int(self.epoch)
+            self.epoch += 1
+        else:
+            segments, seed = segments[worker_info.id::worker_info.num_workers], self.seed + int(self.epoch) + worker_info.id
+
+        if not self.shuffle:
+            yield from self.iter_rows(segments)
+            return
+
+        generator = random.Random(seed)
+        segments = list(segments)
+        generator.shuffle(segments)
+
+        # Shuffle inside a bounded buffer, memory stays at one shard plus the buffer however large the corpus is
+        buffer = []
+        for row in self.iter_rows(segments):
+            if len(buffer) < self.shuffle_buffer_size:
+                buffer.append(row)
+                continue
+
+            index = generator.randrange(len(buffer))
+            yield buffer[index]
+            buffer[index] = row
+
+        generator.shuffle(buffer)
+        yield from buffer
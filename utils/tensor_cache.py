@@ -0,0 +1,56 @@
+import os
+import json
+import hashlib
+import torch
+
+
+def hash_files(paths, chunk_size=1 << 20):
+    # Hash the file contents (not mtime) so copying the CSVs around keeps the cache valid
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_tokenizer(tokenizer):
+    vocab = sorted(tokenizer.get_vocab().items())
+    digest = hashlib.sha256()
+    digest.update(type(tokenizer).__name__.encode('utf-8'))
+    digest.update(json.dumps(vocab, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def build_cache_key(**parts):
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:24]
+
+
+class TensorCache():
+
+    def __init__(self, cache_dir, key) -> None:
+        self.cache_dir = cache_dir
+        self.key = key
+        self.root = os.path.join(cache_dir, key)
+
+    def path(self, step):
+        return os.path.join(self.root, f'{step}.pt')
+
+    def exists(self, steps):
+        return all(os.path.exists(self.path(step)) for step in steps)
+
+    def load(self, step):
+        # mmap=True maps the tensors from disk instead of copying them into RAM up front
+        try:
+            return torch.load(self.path(step), mmap=True, weights_only=True)
+        except TypeError:
+            # torch < 2.1 has no mmap argument
+            return torch.load(self.path(step))
+
+    def save(self, step, tensors):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.path(step) + '.tmp'
+        torch.save(tensors, tmp_path)
+        os.replace(tmp_path, self.path(step))
@@ -0,0 +1,66 @@
+import torch
+from tqdm import tqdm
+from transformers import AutoTokenizer
+
+
+def encode_slow(tokenizer, texts, max_length):
+    input_ids, attention_mask = [], []
+
+    for text in tqdm(texts):
+        encoded_text = tokenizer.encode_plus(
+            text,
+            max_length=max_length,
+            padding="max_length",
+            truncation=True,
+            return_tensors='pt'
+        )
+        input_ids.append(encoded_text['input_ids'].squeeze(0))
+        attention_mask.append(encoded_text['attention_mask'].squeeze(0))
+
+    if len(texts) == 0:
+        return torch.empty((0, max_length), dtype=torch.long), torch.empty((0, max_length), dtype=torch.long)
+
+    return torch.stack(input_ids), torch.stack(attention_mask)
+
+
+def encode_batched(tokenizer, texts, max_length, chunk_size=2048):
+    # Encode whole chunks at once and copy them into preallocated tensors instead of stacking per-row tensors
+    total = len(texts)
+    input_ids = torch.empty((total, max_length), dtype=torch.long)
+    attention_mask = torch.empty((total, max_length), dtype=torch.long)
+
+    for start in tqdm(range(0, total, chunk_size)):
+        chunk = texts[start:start + chunk_size]
+        encoded_text = tokenizer(
+            chunk,
+            max_length=max_length,
+            padding="max_length",
+            truncation=True,
+            return_tensors='np'
+        )
+        input_ids[start:start + len(chunk)] = torch.from_numpy(encoded_text['input_ids'])
+        attention_mask[start:start + len(chunk)] = torch.from_numpy(encoded_text['attention_mask'])
+
+    return input_ids, attention_mask
+
+
+def get_fast_tokenizer(tokenizer):
+    # None when the model has no fast tokenizer or it cannot be converted, the caller keeps the slow one then
+    if tokenizer.is_fast:
+        return tokenizer
+
+    try:
+        fast_tokenizer = AutoTokenizer.from_pretrained(tokenizer.name_or_path, use_fast=True)
+    except (ValueError, OSError, ImportError):
+        return None
+
+    return fast_tokenizer if fast_tokenizer.is_fast else None
+
+
+def mismatched_rows(slow_tokenizer, fast_tokenizer, texts, max_length):
+    slow_input_ids, slow_attention_mask = encode_slow(slow_tokenizer, texts, max_length)
+    fast_input_ids, fast_attention_mask = encode_batched(fast_tokenizer, texts, max_length)
+
+    mismatch = (slow_input_ids != fast_input_ids).any(dim=1) | (slow_attention_mask != fast_attention_mask).any(dim=1)
+
+    return torch.nonzero(mismatch).flatten().tolist()